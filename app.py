@@ -1,28 +1,94 @@
 '''Module responsible for routing'''
-from datetime import datetime
+import os
+import json
+import threading
+import time
+from datetime import datetime, timezone
 from flask_openapi3 import OpenAPI, Info, Tag
-from flask_httpauth import HTTPBasicAuth
-from flask import redirect, request, g
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from flask import redirect, request, g, Response
 from unidecode import unidecode
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
-from model import Reminder, Email, User
+from werkzeug.middleware.proxy_fix import ProxyFix
+from model import Reminder, User, ReminderChange, ArchivedReminder, ChangeRetention, \
+                  SHARD_COUNT, next_reminder_id
 from model import Session
 from logger import logger
+from profiler import init_profiler, is_admin_request, profile_store
+from rate_limit import create_rate_limiter, TRUSTED_PROXIES
+from auth_token import issue_token, verify_token, ACCESS_TOKEN_TTL
+from idempotency import IDEMPOTENCY_HEADER, request_fingerprint, find_response, \
+                        save_response
+from archive import start_archiver
 from schemas import *
 import requests
 
+API2_URL = os.environ.get('API2_URL', 'http://api2:5000')
+# Intervalo de consulta e duração máxima de cada conexão do stream de alterações.
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', '1'))
+CHANGES_STREAM_MAX_SECONDS = float(os.environ.get('CHANGES_STREAM_MAX_SECONDS', '300'))
+# Cada stream ocupa uma thread do servidor enquanto estiver aberto; acima
+# deste número por processo, novos streams recebem 503.
+CHANGES_STREAM_MAX_CLIENTS = int(os.environ.get('CHANGES_STREAM_MAX_CLIENTS', '16'))
+
 info = Info(title = 'Reminder API', version = '1.0.0')
 app = OpenAPI(__name__, info = info)
-app.config['SECRET_KEY'] = 'the quick brown fox jumps over the lazy dog'
-CORS(app)
-auth = HTTPBasicAuth()
+# Chave de assinatura dos tokens. Sem ela, nenhum token é emitido ou aceito.
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+if not app.config['SECRET_KEY']:
+    logger.warning('SECRET_KEY não definida: tokens de acesso desabilitados.')
+CORS(app, expose_headers = ['ETag', 'Retry-After'])
+if TRUSTED_PROXIES:
+    # o IP do cliente, usado pelo limite de requisições, vem do X-Forwarded-For
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for = TRUSTED_PROXIES)
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme = 'Bearer')
+auth = MultiAuth(basic_auth, token_auth)
+init_profiler(app)
+rate_limiter = create_rate_limiter()
+stream_slots = threading.BoundedSemaphore(CHANGES_STREAM_MAX_CLIENTS)
+start_archiver()
 
 documentation_tag = Tag(name = 'Documentação', description = 'Seleção de documentação: Swagger')
 reminder_tag = Tag(name = 'Lembrete', description = 'Adição, edição, visualização individual ou geral e remoção de lembretes')
 prepare_tag = Tag(name = 'Preparo de payload', description = 'Envia o payload do email à API específica para envio de emails.')
 user_tag = Tag(name = 'Usuário', description = 'Adição, validação e busca de usuário.')
 send_email_tag = Tag(name = 'Envio de email', description = 'Rota de envio de email.')
+admin_tag = Tag(name = 'Admin', description = 'Rotas administrativas, como a consulta de perfis de desempenho.')
+
+
+@app.before_request
+def check_rate_limit():
+    '''
+        Rejeita a requisição com 429 antes de qualquer acesso ao banco ou
+        verificação de senha, se o limite da rota foi excedido.
+    '''
+    if rate_limiter is None:
+        return None
+    # só um access token de assinatura válida identifica o usuário, sem
+    # acessar o banco nem o bcrypt
+    user_id = None
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        payload = verify_token(app.config['SECRET_KEY'], authorization[len('Bearer '):], 'access')
+        user_id = payload['uid'] if payload else None
+    retry_after = rate_limiter.check(request, user_id)
+    if not retry_after:
+        return None
+    error_msg = 'Muitas requisições. Tente novamente em alguns segundos.'
+    response, status = format_error_response(error_msg, 429)
+    return response, status, {'Retry-After': str(retry_after)}
+
+
+@app.teardown_request
+def remove_sessions(exception = None):
+    '''
+        Fecha as sessões abertas pela requisição, devolvendo as conexões ao pool.
+    '''
+    Session.remove()
 
 
 @app.get('/', tags = [documentation_tag])
@@ -59,11 +125,13 @@ def new_user(form: UserSchema):
 
 
 @app.post('/user/validate', tags = [user_tag],
-          responses = {'200': UserViewSchema,
+          responses = {'200': UserTokenViewSchema,
                      '400': ErrorSchema})
 def validate_user(form: UserSchema):
     '''
         Faz a validação do username e do hash da senha, salvos na aplicação.
+        Retorna um access token de curta duração e um refresh token, que
+        podem ser usados nas rotas protegidas no lugar da senha.
     '''
     name = form.username
     passkey = form.password
@@ -71,11 +139,45 @@ def validate_user(form: UserSchema):
     user = session.query(User).filter(User.username == name).first()
     if user is not None:
         if user.verify_password(passkey):
-            return { 'username': user.username }, 200
+            return show_tokens(user), 200
     error_msg = 'Não foi encontrado usuário com essas credenciais!'
     return format_error_response(error_msg, 400)
 
 
+@app.post('/user/refresh', tags = [user_tag],
+          responses = {'200': UserTokenViewSchema,
+                     '400': ErrorSchema})
+def refresh_token(form: UserRefreshSchema):
+    '''
+        Emite novos tokens a partir de um refresh token válido, sem
+        verificar a senha novamente. O token é recusado se a senha do
+        usuário mudou depois da sua emissão.
+    '''
+    payload = verify_token(app.config['SECRET_KEY'], form.refresh_token, 'refresh')
+    if payload is not None:
+        session = Session()
+        user = session.query(User).filter(User.id == payload['uid']).first()
+        if user is not None and user.password_version() == payload['pwv']:
+            return show_tokens(user), 200
+    error_msg = 'Refresh token inválido ou expirado!'
+    return format_error_response(error_msg, 400)
+
+
+def show_tokens(user: User):
+    '''
+        Retorna o username com um novo par de tokens do usuário, ou apenas
+        o username se a SECRET_KEY não estiver definida.
+    '''
+    if not app.config['SECRET_KEY']:
+        return {'username': user.username}
+    return {
+        'username': user.username,
+        'access_token': issue_token(app.config['SECRET_KEY'], user, 'access'),
+        'refresh_token': issue_token(app.config['SECRET_KEY'], user, 'refresh'),
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+
 @app.get('/user/get/', tags = [user_tag],
          responses = {'200': UserWithIdViewSchema,
                      '400': ErrorSchema})
@@ -94,7 +196,16 @@ def get_user(query: UserSearchSchema):
         return format_error_response(error_msg, 400)
     return {'username': user.username, 'user_id': user.id}
 
-@auth.verify_password
+def get_logged_user(username: str):
+    '''
+        Retorna o username e o id do usuário logado. Com token, os dados
+        vêm do próprio token e o banco não é consultado.
+    '''
+    if g.get('token_user'):
+        return g.token_user
+    return get_user(username)
+
+@basic_auth.verify_password
 def verify_password(username, password):
     '''
         Rota para validar a sessão do usuário logado em rotas protegidas.
@@ -112,7 +223,23 @@ def verify_password(username, password):
     g.user = user
     return True
 
-@auth.error_handler
+@token_auth.verify_token
+def verify_access_token(token):
+    '''
+        Valida o access token das rotas protegidas apenas pela assinatura
+        e expiração, sem acessar o banco nem o bcrypt.
+    '''
+    payload = verify_token(app.config['SECRET_KEY'], token, 'access')
+    if payload is None:
+        return False
+    username = request.args.get('username')
+    if username and username != payload['sub']:
+        return False
+    g.token_user = {'username': payload['sub'], 'user_id': payload['uid']}
+    return True
+
+@basic_auth.error_handler
+@token_auth.error_handler
 def auth_error():
     error_msg = 'Você precisa estar logado para acessar os lembretes.'
     return format_error_response(error_msg, 403)
@@ -120,6 +247,7 @@ def auth_error():
 @app.post('/create', tags = [reminder_tag],
         responses = {'200': ReminderViewSchema,
                      '409': ErrorSchema,
+                     '422': ErrorSchema,
                      '400': ErrorSchema})
 @auth.login_required
 def create(form: ReminderSchema, query: ReminderCreateOrUpdateSchema):
@@ -127,27 +255,67 @@ def create(form: ReminderSchema, query: ReminderCreateOrUpdateSchema):
         Persiste um novo lembrete no banco de dados.
         Se for inserido um email válido e a flag send_email como True,
         enviará um email com os dados do lembrete.
+        Com o cabeçalho Idempotency-Key, uma requisição repetida com a mesma
+        chave retorna a resposta original, sem gravar nem enviar email.
     '''
     if request.args.get('username'):
         username = request.args.get('username')
     else:
         username = query.username
-    user = get_user(username)
+    user = get_logged_user(username)
+    session = Session(user['user_id'])
+
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    fingerprint = request_fingerprint(form.dict())
+    if idempotency_key:
+        saved = find_response(session, user['user_id'], idempotency_key)
+        if saved is not None:
+            return replay_response(saved, fingerprint)
+
     reminder = Reminder(
         name = form.name,
         description = form.description,
         user_id = user['user_id'],
         due_date = datetime.strptime(form.due_date, '%Y-%m-%dT%H:%M:%S.%fZ'),
         send_email = form.send_email,
-        recurring = form.recurring)
+        recurring = form.recurring,
+        email = form.email)
 
     try:
-        reminder.insert_email(Email(form.email))
-        session = Session()
-        session.add(reminder)
+        statement = insert(Reminder).values(**reminder.insert_values())
+        if SHARD_COUNT > 1:
+            statement = statement.values(
+                {Reminder.__table__.c.pk_reminder: next_reminder_id(reminder.user_id)})
+        statement = statement.on_conflict_do_nothing(index_elements = ['user_id', 'name'])
+        result = session.execute(statement)
+        if result.rowcount:
+            reminder.id = result.lastrowid
+            record_change(session, 'create', reminder)
+            response, status = show_reminder(reminder), 200
+        else:
+            error_msg = 'Lembrete de mesmo nome já salvo :/'
+            logger.warning('Erro ao adicionar lembrete %s - %s', reminder.name, error_msg)
+            response, status = format_error_response(error_msg, 409)
+        # a chave é gravada na mesma transação do lembrete: se outra
+        # requisição com a mesma chave gravou antes, esta é desfeita e
+        # a resposta gravada por ela é repetida
+        if idempotency_key and not save_response(
+                session, user['user_id'], idempotency_key, fingerprint,
+                status, app.json.dumps(response)):
+            session.rollback()
+            return replay_response(
+                find_response(session, user['user_id'], idempotency_key), fingerprint)
         session.commit()
+    except Exception as error:
+        error_msg = 'Ocorreu um erro ao salvar o lembrete.'
+        logger.warning(' %s : %s', error_msg, error)
+        logger.debug(' %s : %s', error_msg, error)
+
+        return format_error_response(error_msg, 400)
+
+    if status == 200:
         if reminder.validate_email_before_send():
-            email_receiver = reminder.email_relationship[0].email
+            email_receiver = reminder.email
             due_date_adjusted = reminder.due_date.strftime('%d/%m/%Y')
             payload = {
                 'name': reminder.name,
@@ -157,21 +325,7 @@ def create(form: ReminderSchema, query: ReminderCreateOrUpdateSchema):
                 'flag': 'create'
             }
             __sent_email_payload(payload)
-
-        return show_reminder(reminder), 200
-
-    except IntegrityError:
-        error_msg = 'Lembrete de mesmo nome já salvo :/'
-        logger.warning('Erro ao adicionar lembrete %s - %s', reminder.name, error_msg)
-
-        return format_error_response(error_msg, 409)
-
-    except Exception as error:
-        error_msg = 'Ocorreu um erro ao salvar o lembrete.'
-        logger.warning(' %s : %s', error_msg, error)
-        logger.debug(' %s : %s', error_msg, error)
-
-        return format_error_response(error_msg, 400)
+    return response, status
 
 @app.get('/reminder', tags = [reminder_tag],
         responses = {'200': ReminderViewSchema, '404': ErrorSchema})
@@ -185,10 +339,10 @@ def get_reminder(query: ReminderSearchSchema):
         username = request.args.get('username')
     else:
         username = query.username
-    user = get_user(username)
+    user = get_logged_user(username)
     logger.info('Coletando dados sobre o lembrete # %s', reminder_id)
     try:
-        session = Session()
+        session = Session(user['user_id'])
         reminder = session.query(Reminder).filter(
                 Reminder.id == reminder_id,
                 Reminder.user_id == user['user_id']
@@ -202,7 +356,7 @@ def get_reminder(query: ReminderSearchSchema):
         return format_error_response(error_msg, 404)
     logger.debug('Lembrete econtrado: %s', reminder.name)
 
-    return show_reminder(reminder), 200
+    return show_reminder(reminder), 200, {'ETag': '"%s"' % reminder.version()}
 
 @app.get('/reminder_name', tags = [reminder_tag],
         responses = {'200': ReminderViewSchema, '404': ErrorSchema})
@@ -216,10 +370,10 @@ def get_reminder_name(query: ReminderSearchByNameSchema):
         username = request.args.get('username')
     else:
         username = query.username
-    user = get_user(username)
+    user = get_logged_user(username)
     logger.info('Coletando dados sobre o lembrete # %s', reminder_name)
 
-    session = Session()
+    session = Session(user['user_id'])
     name_normalized = unidecode(reminder_name.lower())
     reminder = session.query(Reminder).filter(
             Reminder.name_normalized == name_normalized,
@@ -245,8 +399,8 @@ def get_all_reminders(query: RemindersSearchSchema):
         username = request.args.get('username')
     else:
         username = query.username
-    session = Session()
-    user = get_user(username)
+    user = get_logged_user(username)
+    session = Session(user['user_id'])
     reminders = session.query(Reminder).filter(Reminder.user_id == user['user_id']).all()
 
     if not reminders:
@@ -255,55 +409,116 @@ def get_all_reminders(query: RemindersSearchSchema):
     logger.debug('%d lembretes encontrados', len(reminders))
     return show_reminders(reminders), 200
 
+@app.get('/reminders/archived', tags = [reminder_tag],
+         responses = {'200': RemindersListSchema, '400': ErrorSchema})
+@auth.login_required
+def get_archived_reminders(query: RemindersArchivedSearchSchema):
+    '''
+        Retorna os lembretes arquivados (vencidos e não recorrentes) de
+        usuário específico, do vencimento mais recente ao mais antigo.
+    '''
+    if request.args.get('username'):
+        username = request.args.get('username')
+    else:
+        username = query.username
+    user = get_logged_user(username)
+    session = Session(user['user_id'])
+    reminders = session.query(ArchivedReminder).filter(
+            ArchivedReminder.user_id == user['user_id']
+        ).order_by(ArchivedReminder.due_date.desc()
+        ).offset(query.offset).limit(query.limit).all()
+
+    logger.debug('%d lembretes arquivados encontrados', len(reminders))
+    return show_reminders(reminders), 200
+
 @app.put('/update', tags = [reminder_tag],
-         responses = {'200': ReminderViewSchema, '404': ErrorSchema})
+         responses = {'200': ReminderViewSchema, '404': ErrorSchema,
+                      '409': ErrorSchema, '412': ErrorSchema})
 @auth.login_required
 def update(form: ReminderUpdateSchema, query: ReminderCreateOrUpdateSchema):
     '''
-        Atualiza um lembrete pelo id. Se for inserido um email válido e a flag
-        send_email como True, enviará um email com os dados do lembrete.
+        Atualiza um lembrete pelo id, gravando apenas os campos enviados que
+        mudaram. Se nada mudou, não grava nem envia email. Com o cabeçalho
+        If-Match (o ETag retornado pelas rotas /reminder e /update), a
+        atualização só ocorre se o lembrete não foi alterado desde então.
+        Se houve alteração, for inserido um email válido e a flag send_email
+        for True, enviará um email com os dados do lembrete.
     '''
-    session = Session()
     if request.args.get('username'):
         username = request.args.get('username')
     else:
         username = query.username
-    session = Session()
-    user = get_user(username)
+    user = get_logged_user(username)
+    session = Session(user['user_id'])
     reminder = session.query(Reminder).filter(
             Reminder.id == form.id,
             Reminder.user_id == user['user_id']
         ).first()
-    try:
-        reminder.name = form.name or reminder.name
-        reminder.name_normalized = unidecode(form.name.lower())
-        reminder.description = form.description or reminder.description
-        reminder.due_date = form.due_date or reminder.due_date
-        reminder.send_email = form.send_email
-        reminder.email_relationship[0].email = form.email
-        reminder.recurring = form.recurring
-        reminder.updated_at = datetime.now()
-        session.commit()
+    if reminder is None:
+        error_msg = 'O lembrete buscado não existe.'
+        logger.warning('Erro ao atualizar lembrete # %d - %s', form.id, error_msg)
+        return format_error_response(error_msg, 404)
 
-        if reminder.validate_email_before_send():
-            email_receiver = reminder.email_relationship[0].email
-            due_date_adjusted = reminder.due_date.strftime('%d/%m/%Y')
-            payload = {
-                'name': reminder.name,
-                'description': reminder.description,
-                'due_date': due_date_adjusted,
-                'email_receiver': email_receiver,
-                'flag': 'update'
-            }
-            __sent_email_payload(payload)
+    if_match = request.headers.get('If-Match')
+    if if_match and not etag_matches(if_match, reminder.version()):
+        error_msg = 'O lembrete foi alterado por outra requisição.'
+        return format_error_response(error_msg, 412)
 
-        return show_reminder(reminder), 200
+    # como em /create, a data é gravada em UTC, sem fuso
+    due_date = form.due_date
+    if due_date and due_date.tzinfo:
+        due_date = due_date.astimezone(timezone.utc).replace(tzinfo = None)
+    values = reminder.changed_values(
+        name = form.name,
+        description = form.description,
+        due_date = due_date,
+        send_email = form.send_email,
+        email = form.email,
+        recurring = form.recurring)
+    if not values:
+        logger.debug('Lembrete # %d sem alterações.', reminder.id)
+        return show_reminder(reminder), 200, {'ETag': '"%s"' % reminder.version()}
 
+    # a condição em updated_at torna a gravação um compare-and-swap
+    previous_version = reminder.updated_at
+    values['updated_at'] = datetime.now()
+    try:
+        updated = session.query(Reminder).filter(
+                Reminder.id == reminder.id,
+                Reminder.user_id == user['user_id'],
+                Reminder.updated_at == previous_version if previous_version
+                    else Reminder.updated_at.is_(None)
+            ).update(values, synchronize_session = 'evaluate')
+        if not updated:
+            session.rollback()
+            error_msg = 'O lembrete foi alterado por outra requisição.'
+            return format_error_response(error_msg, 412)
+        record_change(session, 'update', reminder)
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        error_msg = 'Lembrete de mesmo nome já salvo :/'
+        logger.warning('Erro ao atualizar lembrete %s - %s', form.name, error_msg)
+        return format_error_response(error_msg, 409)
     except Exception as error:
         error_msg = 'Ocorreu um erro ao salvar o lembrete na base'
         logger.info(' %s : %s', error_msg, error)
         return format_error_response(error_msg, 500)
 
+    if reminder.validate_email_before_send():
+        email_receiver = reminder.email
+        due_date_adjusted = reminder.due_date.strftime('%d/%m/%Y')
+        payload = {
+            'name': reminder.name,
+            'description': reminder.description,
+            'due_date': due_date_adjusted,
+            'email_receiver': email_receiver,
+            'flag': 'update'
+        }
+        __sent_email_payload(payload)
+
+    return show_reminder(reminder), 200, {'ETag': '"%s"' % reminder.version()}
+
 @app.delete('/delete', tags = [reminder_tag],
             responses = {'200': ReminderDeleteSchema, '404': ErrorSchema})
 @auth.login_required
@@ -312,18 +527,24 @@ def delete_reminder(query: ReminderSearchSchema):
         Remove um lembrete pelo id.
     '''
     reminder_id = query.id
-    user = get_user(request.args.get('username'))
+    user = get_logged_user(request.args.get('username'))
     logger.debug('Deletando dados do lembrete # %d', reminder_id)
 
-    session = Session()
+    session = Session(user['user_id'])
     try:
-        session.query(Email).filter(Email.reminder == reminder_id).delete()
-        reminder_query = session.query(Reminder).filter(
+        # um único DELETE ... RETURNING remove o lembrete e devolve os dados
+        # usados na resposta e no log de alterações
+        deleted = session.execute(
+            delete(Reminder).where(
                 Reminder.id == reminder_id,
                 Reminder.user_id == user['user_id']
-            )
-        reminder = reminder_query.first()
-        reminder_query.delete()
+            ).returning(Reminder.id, Reminder.name, Reminder.user_id),
+            execution_options = {'synchronize_session': False}
+        ).first()
+        if deleted is None:
+            raise LookupError(reminder_id)
+        reminder_name = deleted.name
+        record_change(session, 'delete', deleted)
         session.commit()
     except:
         error_msg = 'Lembrete não encontrado :/'
@@ -331,7 +552,165 @@ def delete_reminder(query: ReminderSearchSchema):
         return format_error_response(error_msg, 404)
 
     logger.debug('Lembrete # %d removido com sucesso.', reminder_id)
-    return {'mensagem': 'Lembrete removido', 'nome': reminder.name}
+    return {'mensagem': 'Lembrete removido', 'nome': reminder_name}
+
+
+@app.get('/reminders/changes', tags = [reminder_tag],
+         responses = {'200': ReminderChangesListSchema, '400': ErrorSchema})
+@auth.login_required
+def get_reminder_changes(query: ReminderChangesSearchSchema):
+    '''
+        Retorna as alterações dos lembretes do usuário com seq maior que
+        since, em ordem. O cliente guarda o last_seq retornado e o envia
+        como since na próxima chamada, sem baixar a lista inteira.
+        Se alterações posteriores a since já saíram do log, retorna
+        resync True: o cliente recarrega os lembretes e continua do last_seq.
+    '''
+    if request.args.get('username'):
+        username = request.args.get('username')
+    else:
+        username = query.username
+    user = get_logged_user(username)
+    session = Session(user['user_id'])
+    pruned_seq = find_pruned_seq(session, user['user_id'])
+    if query.since < pruned_seq:
+        return {'changes': [], 'last_seq': pruned_seq, 'resync': True}, 200
+    changes = find_changes(session, user['user_id'], query.since, query.limit)
+
+    last_seq = changes[-1].seq if changes else query.since
+    return {'changes': [change.to_dict() for change in changes], 'last_seq': last_seq,
+            'resync': False}, 200
+
+@app.get('/reminders/changes/stream', tags = [reminder_tag],
+         responses = {'200': ReminderChangeSchema, '400': ErrorSchema})
+@auth.login_required
+def stream_reminder_changes(query: ReminderChangesSearchSchema):
+    '''
+        Stream (Server-Sent Events) das alterações dos lembretes do usuário.
+        Cada evento tem id igual ao seq, permitindo retomar a conexão com o
+        cabeçalho Last-Event-ID. A conexão é encerrada após
+        CHANGES_STREAM_MAX_SECONDS e o cliente reconecta automaticamente.
+        Se alterações posteriores a since já saíram do log, o primeiro evento
+        é resync. Acima de CHANGES_STREAM_MAX_CLIENTS streams abertos no
+        processo, responde 503.
+    '''
+    if request.args.get('username'):
+        username = request.args.get('username')
+    else:
+        username = query.username
+    user_id = get_logged_user(username)['user_id']
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    since = int(last_event_id) if last_event_id.isdigit() else query.since
+
+    if not stream_slots.acquire(blocking = False):
+        error_msg = 'Muitos streams abertos. Tente novamente em alguns segundos.'
+        response, status = format_error_response(error_msg, 503)
+        return response, status, {'Retry-After': '5'}
+
+    def events(since):
+        try:
+            pruned_seq = find_pruned_seq(Session(user_id), user_id)
+        finally:
+            Session.remove()
+        if since < pruned_seq:
+            since = pruned_seq
+            yield 'id: %d\nevent: resync\ndata: %s\n\n' % (
+                since, json.dumps({'last_seq': since}))
+        deadline = time.monotonic() + CHANGES_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            try:
+                changes = find_changes(Session(user_id), user_id, since, query.limit)
+            finally:
+                Session.remove()
+            for change in changes:
+                since = change.seq
+                yield 'id: %d\nevent: %s\ndata: %s\n\n' % (
+                    change.seq, change.operation, json.dumps(change.to_dict()))
+            if not changes:
+                yield ': keep-alive\n\n'
+                time.sleep(CHANGES_POLL_INTERVAL)
+
+    response = Response(events(since), mimetype = 'text/event-stream',
+                        headers = {'Cache-Control': 'no-cache'})
+    # liberado ao fechar a resposta, mesmo se o cliente desconectar antes
+    response.call_on_close(stream_slots.release)
+    return response
+
+def etag_matches(if_match: str, version: str) -> bool:
+    '''
+        Compara o cabeçalho If-Match com a versão do lembrete. Aceita uma
+        lista de ETags separadas por vírgula; '*' aceita qualquer versão de
+        um lembrete existente.
+    '''
+    etags = [etag.strip() for etag in if_match.split(',')]
+    return '*' in etags or version in [etag.replace('W/', '').strip('"') for etag in etags]
+
+def replay_response(saved, fingerprint: str):
+    '''
+        Repete a resposta gravada para a Idempotency-Key, ou retorna 422 se
+        a chave foi usada com outros dados.
+    '''
+    if saved.fingerprint != fingerprint:
+        error_msg = 'Idempotency-Key já utilizada com outros dados.'
+        return format_error_response(error_msg, 422)
+    logger.debug('Resposta repetida para Idempotency-Key %s', saved.key)
+    return Response(saved.response, status = saved.status, mimetype = 'application/json')
+
+def find_pruned_seq(session, user_id: int) -> int:
+    '''
+        Retorna o maior seq do usuário já removido do log, ou 0.
+    '''
+    retention = session.get(ChangeRetention, user_id)
+    return retention.pruned_seq if retention else 0
+
+def find_changes(session, user_id: int, since: int, limit: int) -> list:
+    '''
+        Busca as alterações do usuário posteriores à sequência since.
+    '''
+    return session.query(ReminderChange).filter(
+            ReminderChange.user_id == user_id,
+            ReminderChange.seq > since
+        ).order_by(ReminderChange.seq).limit(limit).all()
+
+def record_change(session, operation: str, reminder: Reminder):
+    '''
+        Registra a alteração do lembrete na mesma transação da alteração.
+        Na remoção, basta uma linha com id e user_id.
+    '''
+    data = None
+    if operation != 'delete':
+        data = app.json.dumps(show_reminder(reminder))
+    session.add(ReminderChange(reminder.user_id, reminder.id, operation, data))
+
+
+@app.get('/admin/profiles', tags = [admin_tag],
+         responses = {'200': ProfileListSchema, '403': ErrorSchema, '404': ErrorSchema})
+def get_profiles(query: ProfileSearchSchema):
+    '''
+        Retorna os perfis agregados por rota, em pstats ou collapsed stacks
+        (formato de entrada de flamegraph). Exige o cabeçalho X-Profile-Token.
+    '''
+    if not is_admin_request():
+        error_msg = 'Acesso restrito ao administrador.'
+        return format_error_response(error_msg, 403)
+
+    if query.reset:
+        profile_store.reset()
+        logger.info('Perfis de desempenho removidos.')
+        return {'routes': {}}, 200
+
+    if not query.route:
+        return {'routes': profile_store.routes()}, 200
+
+    if query.format == 'collapsed':
+        body = profile_store.collapsed_text(query.route)
+    else:
+        body = profile_store.pstats_text(query.route)
+    if not body:
+        error_msg = 'Não há perfis para esta rota.'
+        return format_error_response(error_msg, 404)
+
+    return Response(body, mimetype = 'text/plain')
 
 
 def __sent_email_payload(body: SendEmailSchema):
@@ -340,7 +719,7 @@ def __sent_email_payload(body: SendEmailSchema):
     '''
     try:
         headers = {'Content-Type': 'application/json'}
-        response = requests.post('http://api2:5000/prepare', json=body, headers=headers)
+        response = requests.post('%s/prepare' % API2_URL, json=body, headers=headers)
         response.raise_for_status()
 
         return response
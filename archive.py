@@ -0,0 +1,169 @@
+'''
+    Module responsible for archiving expired non-recurring reminders and
+    pruning the reminder change log.
+
+    Uso (na raiz do repositório):
+        python -m archive --batch-size 500
+'''
+from datetime import datetime, timedelta
+import argparse
+import os
+import threading
+import time
+
+from sqlalchemy import select, literal, or_, func, DateTime, String
+from sqlalchemy.dialects.sqlite import insert
+from model import Session, Reminder, ArchivedReminder, ReminderChange, ChangeRetention
+from logger import logger
+
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '0'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+# Pausa entre lotes, liberando o banco para as escritas das rotas.
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.05'))
+# Tempo, em segundos, que as alterações ficam no log (0 mantém para sempre).
+CHANGES_RETENTION = float(os.environ.get('CHANGES_RETENTION', str(7 * 24 * 3600)))
+
+
+def archive_batch(engine, now: datetime, batch_size: int) -> int:
+    '''
+        Move até batch_size lembretes vencidos e não recorrentes para a
+        tabela reminders_archive, em uma transação curta. Registra uma
+        alteração 'archive' no log de alterações de cada lembrete movido.
+        Retorna quantos lembretes foram arquivados.
+    '''
+    reminders = Reminder.__table__
+    archive = ArchivedReminder.__table__
+    changes = ReminderChange.__table__
+    columns = [column.name for column in reminders.columns]
+
+    with engine.begin() as connection:
+        ids = connection.execute(
+            select(reminders.c.pk_reminder).where(
+                reminders.c.due_date < now,
+                or_(reminders.c.recurring == False, reminders.c.recurring.is_(None))
+            ).order_by(reminders.c.pk_reminder).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        selected = reminders.c.pk_reminder.in_(ids)
+        connection.execute(archive.insert().from_select(
+            columns + ['archived_at'],
+            select(*[reminders.c[name] for name in columns],
+                   literal(now, DateTime)).where(selected)))
+        connection.execute(changes.insert().from_select(
+            ['user_id', 'reminder_id', 'operation', 'created_at'],
+            select(reminders.c.user_id, reminders.c.pk_reminder,
+                   literal('archive', String), literal(now, DateTime)).where(selected)))
+        connection.execute(reminders.delete().where(selected))
+    return len(ids)
+
+
+def archive_expired(batch_size: int = ARCHIVE_BATCH_SIZE,
+                    pause: float = ARCHIVE_BATCH_PAUSE) -> int:
+    '''
+        Arquiva todos os lembretes vencidos em lotes, até não haver mais,
+        em cada banco que guarda lembretes (os shards, se houver).
+        Retorna o total arquivado.
+    '''
+    now = datetime.now()
+    total = 0
+    for engine in Session.reminder_engines():
+        while True:
+            archived = archive_batch(engine, now, batch_size)
+            total += archived
+            if archived < batch_size:
+                break
+            time.sleep(pause)
+    if total:
+        logger.info('%d lembretes vencidos arquivados.', total)
+    return total
+
+
+def prune_batch(engine, before: datetime, batch_size: int) -> int:
+    '''
+        Remove até batch_size alterações anteriores a before, em uma
+        transação curta, e guarda por usuário o maior seq removido, usado
+        para avisar os clientes que precisam sincronizar de novo.
+        Retorna quantas alterações foram removidas.
+    '''
+    changes = ReminderChange.__table__
+    retention = ChangeRetention.__table__
+
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(changes.c.seq, changes.c.user_id).where(
+                changes.c.created_at < before
+            ).order_by(changes.c.seq).limit(batch_size)
+        ).all()
+        if not rows:
+            return 0
+
+        pruned = {}
+        for seq, user_id in rows:
+            pruned[user_id] = max(seq, pruned.get(user_id, 0))
+        statement = insert(retention)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements = ['user_id'],
+            set_ = {'pruned_seq': func.max(retention.c.pruned_seq, statement.excluded.pruned_seq)}
+        ), [{'user_id': user_id, 'pruned_seq': seq} for user_id, seq in pruned.items()])
+        connection.execute(changes.delete().where(
+            changes.c.seq.in_([seq for seq, _ in rows])))
+    return len(rows)
+
+
+def prune_changes(retention: float = CHANGES_RETENTION,
+                  batch_size: int = ARCHIVE_BATCH_SIZE,
+                  pause: float = ARCHIVE_BATCH_PAUSE) -> int:
+    '''
+        Remove do log as alterações mais antigas que retention segundos,
+        em lotes, em cada banco que guarda lembretes. Retorna o total removido.
+    '''
+    if retention <= 0:
+        return 0
+    before = datetime.now() - timedelta(seconds = retention)
+    total = 0
+    for engine in Session.reminder_engines():
+        while True:
+            pruned = prune_batch(engine, before, batch_size)
+            total += pruned
+            if pruned < batch_size:
+                break
+            time.sleep(pause)
+    if total:
+        logger.info('%d alterações antigas removidas do log.', total)
+    return total
+
+
+def _run_periodically(interval: float):
+    while True:
+        try:
+            archive_expired()
+            prune_changes()
+        except Exception as error:
+            logger.error('Erro ao arquivar lembretes: %s', error)
+        time.sleep(interval)
+
+
+def start_archiver():
+    '''
+        Inicia o arquivamento periódico e a limpeza do log de alterações em
+        uma thread, se ARCHIVE_INTERVAL (em segundos) for maior que zero.
+    '''
+    if ARCHIVE_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target = _run_periodically, args = (ARCHIVE_INTERVAL,),
+                              daemon = True, name = 'archiver')
+    thread.start()
+    logger.info('Arquivamento de lembretes a cada %.0fs.', ARCHIVE_INTERVAL)
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Arquiva os lembretes vencidos.')
+    parser.add_argument('--batch-size', type = int, default = ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type = float, default = ARCHIVE_BATCH_PAUSE)
+    args = parser.parse_args()
+    print('%d lembretes arquivados.' % archive_expired(args.batch_size, args.pause))
+    print('%d alterações removidas do log.' % prune_changes(
+        batch_size = args.batch_size, pause = args.pause))
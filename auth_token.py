@@ -0,0 +1,69 @@
+'''Module responsible for issuing and verifying signed access and refresh tokens'''
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', '900'))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', '604800'))
+TOKEN_TTLS = {'access': ACCESS_TOKEN_TTL, 'refresh': REFRESH_TOKEN_TTL}
+
+
+def _encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(secret: str, body: str) -> str:
+    digest = hmac.new(secret.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+    return _encode(digest)
+
+
+def issue_token(secret: str, user, kind: str) -> str:
+    '''
+        Gera um token '<payload>.<assinatura>' com o id e o username do
+        usuário, o tipo (access ou refresh), a expiração e a versão do hash
+        da senha. A assinatura é um HMAC-SHA256 do payload.
+        Sem chave, nenhum token é emitido.
+    '''
+    if not secret:
+        raise ValueError('SECRET_KEY não definida.')
+    payload = {
+        'uid': user.get_id(),
+        'sub': user.username,
+        'typ': kind,
+        'exp': int(time.time()) + TOKEN_TTLS[kind],
+        'pwv': user.password_version(),
+    }
+    body = _encode(json.dumps(payload, separators = (',', ':')).encode('utf-8'))
+    return '%s.%s' % (body, _sign(secret, body))
+
+
+def verify_token(secret: str, token: str, kind: str):
+    '''
+        Valida a assinatura (em tempo constante), o tipo e a expiração do
+        token, sem acessar o banco. Retorna o payload ou None se for inválido.
+        Sem chave, nenhum token é aceito. Tokens válidos são sempre ASCII;
+        os demais são rejeitados antes da assinatura, que não aceita outros
+        caracteres.
+    '''
+    if not secret or not isinstance(token, str) or not token.isascii():
+        return None
+    try:
+        body, signature = token.split('.')
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(secret, body)):
+        return None
+    try:
+        payload = json.loads(_decode(body))
+    except ValueError:
+        return None
+    if payload.get('typ') != kind or payload.get('exp', 0) < time.time():
+        return None
+    return payload
@@ -0,0 +1 @@
+'''Package responsible for the load-test and benchmark suite of the routes'''
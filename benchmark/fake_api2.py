@@ -0,0 +1,41 @@
+'''Module responsible for a local fake of the api2 /prepare route'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+
+class FakePrepareHandler(BaseHTTPRequestHandler):
+    '''
+        Responde a POST /prepare como a api2, sem enviar nenhum email.
+    '''
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.path != '/prepare':
+            self.send_response(404)
+            self.end_headers()
+            return
+        with FakePrepareHandler.lock:
+            FakePrepareHandler.received += 1
+        body = b'{"mensagem": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        '''Silencia o log de acesso do servidor fake.'''
+
+
+def start_fake_api2(host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    '''
+        Sobe o servidor fake da api2 em uma thread e retorna o servidor.
+        Com port = 0 o sistema operacional escolhe uma porta livre.
+    '''
+    server = ThreadingHTTPServer((host, port), FakePrepareHandler)
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    return server
@@ -0,0 +1,488 @@
+'''
+    Module responsible for running the reproducible benchmark of every route.
+
+    A aplicação roda em --workers processos separados (benchmark.server),
+    e as requisições são distribuídas entre eles; RSS e queries são lidos
+    dos workers, não do processo que gera a carga.
+
+    Uso (na raiz do repositório):
+        python -m benchmark.run --users 10 --reminders 20 --concurrency 8
+        python -m benchmark.run --workers 4 --shards 4
+        python -m benchmark.run --compare benchmark/results/<commit>.json
+'''
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark.fake_api2 import FakePrepareHandler, start_fake_api2
+
+RESULTS_PATH = 'benchmark/results/'
+PASSWORD = 'senha-benchmark'
+DUE_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def alpha_name(prefix: str, number: int) -> str:
+    '''
+        Converte um número em um nome apenas com letras, pois os validators
+        de usuário e lembrete não aceitam números.
+    '''
+    letters = ''
+    number += 1
+    while number:
+        number, rest = divmod(number - 1, 26)
+        letters = chr(ord('a') + rest) + letters
+    return '%s %s' % (prefix, letters)
+
+
+def percentile(values: list, fraction: float) -> float:
+    '''
+        Retorna o percentil (nearest-rank) de uma lista ordenada.
+    '''
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def current_rss_kb() -> int:
+    '''
+        Retorna o RSS atual do processo em KB, ou o pico se /proc não existir.
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_commit() -> str:
+    '''
+        Retorna o commit atual, usado para nomear o arquivo de resultados.
+    '''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class QueryCounter:
+    '''
+        Conta as queries executadas pelo engine do SQLAlchemy.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.count += 1
+
+
+def seed(users: int, reminders: int, secret: str) -> tuple:
+    '''
+        Cria N usuários e M lembretes por usuário diretamente no banco,
+        mais alguns lembretes vencidos, que serão arquivados. Os lembretes
+        são gravados como em /create: pela sessão do shard do usuário e,
+        com shards, com ids na faixa do usuário.
+        Retorna a lista de (username, [ids dos lembretes], [nomes]) e os
+        tokens (access, refresh) de cada username.
+    '''
+    from sqlalchemy.dialects.sqlite import insert
+    from model import Session, User, Reminder, SHARD_COUNT, next_reminder_id
+    from auth_token import issue_token
+
+    session = Session()
+    created_users = [User(alpha_name('bench user', user_index), PASSWORD)
+                     for user_index in range(users)]
+    session.add_all(created_users)
+    session.commit()
+
+    seeded = []
+    tokens = {}
+    due_date = datetime.now() + timedelta(days = 30)
+    expired_date = datetime.now() - timedelta(days = 1)
+    for user_index, user in enumerate(created_users):
+        reminder_session = Session(user.id)
+        names = [alpha_name('seed %s' % alpha_name('u', user_index), reminder_index)
+                 for reminder_index in range(reminders)]
+        expired_names = [alpha_name('old %s' % alpha_name('u', user_index), expired_index)
+                         for expired_index in range(max(1, reminders // 4))]
+        created = []
+        for name in names + expired_names:
+            reminder = Reminder(
+                name = name,
+                description = 'lembrete de benchmark',
+                user_id = user.id,
+                due_date = due_date if name in names else expired_date,
+                email = 'bench@email.com')
+            statement = insert(Reminder).values(**reminder.insert_values())
+            if SHARD_COUNT > 1:
+                statement = statement.values(
+                    {Reminder.__table__.c.pk_reminder: next_reminder_id(user.id)})
+            reminder.id = reminder_session.execute(statement).lastrowid
+            created.append(reminder)
+        reminder_session.commit()
+        seeded.append((user.username,
+                       [reminder.id for reminder in created[:reminders]],
+                       names))
+        tokens[user.username] = (issue_token(secret, user, 'access'),
+                                 issue_token(secret, user, 'refresh'))
+    Session.remove()
+    return seeded, tokens
+
+
+def build_scenarios(seeded: list, tokens: dict, total: int) -> list:
+    '''
+        Define, para cada rota de app.py, a função que gera a n-ésima requisição.
+        A ordem importa: /delete remove os lembretes criados por /create.
+        O stream /reminders/changes/stream não entra, pois não termina.
+    '''
+    due_date = (datetime.now() + timedelta(days = 10)).strftime(DUE_DATE_FORMAT)
+    created_ids = []
+    created_lock = threading.Lock()
+
+    def user_at(index):
+        return seeded[index % len(seeded)]
+
+    def auth_for(username):
+        return (username, PASSWORD)
+
+    def documentation(index):
+        return {'method': 'GET', 'path': '/', 'allow_redirects': False}
+
+    def user_create(index):
+        return {'method': 'POST', 'path': '/user/create',
+                'data': {'username': alpha_name('new user', index), 'password': PASSWORD}}
+
+    def user_validate(index):
+        username = user_at(index)[0]
+        return {'method': 'POST', 'path': '/user/validate',
+                'data': {'username': username, 'password': PASSWORD}}
+
+    def user_refresh(index):
+        username = user_at(index)[0]
+        return {'method': 'POST', 'path': '/user/refresh',
+                'data': {'refresh_token': tokens[username][1]}}
+
+    def user_get(index):
+        return {'method': 'GET', 'path': '/user/get/',
+                'params': {'username': user_at(index)[0]}}
+
+    def create(index):
+        username = user_at(index)[0]
+        return {'method': 'POST', 'path': '/create', 'auth': auth_for(username),
+                'params': {'username': username},
+                'data': {'name': alpha_name('created', index),
+                         'description': 'criado pelo benchmark',
+                         'due_date': due_date,
+                         'send_email': 'true',
+                         'email': 'bench@email.com',
+                         'recurring': 'false'},
+                'collect': (created_ids, created_lock, username)}
+
+    def create_token(index):
+        username = user_at(index)[0]
+        spec = create(index)
+        spec['data']['name'] = alpha_name('created token', index)
+        spec.pop('auth')
+        spec['headers'] = {'Authorization': 'Bearer %s' % tokens[username][0]}
+        return spec
+
+    def get_reminder(index):
+        username, ids, _ = user_at(index)
+        return {'method': 'GET', 'path': '/reminder', 'auth': auth_for(username),
+                'params': {'username': username, 'id': ids[index % len(ids)]}}
+
+    def get_reminder_name(index):
+        username, _, names = user_at(index)
+        return {'method': 'GET', 'path': '/reminder_name', 'auth': auth_for(username),
+                'params': {'username': username, 'name': names[index % len(names)]}}
+
+    def get_all_reminders(index):
+        username = user_at(index)[0]
+        return {'method': 'GET', 'path': '/reminders', 'auth': auth_for(username),
+                'params': {'username': username}}
+
+    def get_all_reminders_token(index):
+        username = user_at(index)[0]
+        return {'method': 'GET', 'path': '/reminders',
+                'headers': {'Authorization': 'Bearer %s' % tokens[username][0]},
+                'params': {'username': username}}
+
+    def get_reminder_changes(index):
+        username = user_at(index)[0]
+        return {'method': 'GET', 'path': '/reminders/changes', 'auth': auth_for(username),
+                'params': {'username': username, 'since': 0}}
+
+    def get_archived_reminders(index):
+        username = user_at(index)[0]
+        return {'method': 'GET', 'path': '/reminders/archived', 'auth': auth_for(username),
+                'params': {'username': username}}
+
+    def get_profiles(index):
+        return {'method': 'GET', 'path': '/admin/profiles',
+                'headers': {'X-Profile-Token': os.environ['PROFILE_ADMIN_TOKEN']}}
+
+    def update(index):
+        username, ids, names = user_at(index)
+        position = index % len(ids)
+        return {'method': 'PUT', 'path': '/update', 'auth': auth_for(username),
+                'params': {'username': username},
+                'data': {'id': ids[position],
+                         'name': names[position],
+                         'description': 'atualizado pelo benchmark',
+                         'due_date': due_date,
+                         'send_email': 'true',
+                         'email': 'bench@email.com',
+                         'recurring': 'false'}}
+
+    def delete_reminder(index):
+        with created_lock:
+            if not created_ids:
+                return None
+            username, reminder_id = created_ids.pop()
+        return {'method': 'DELETE', 'path': '/delete', 'auth': auth_for(username),
+                'params': {'username': username, 'id': reminder_id}}
+
+    return [
+        ('GET /', documentation, total),
+        ('POST /user/create', user_create, total),
+        ('POST /user/validate', user_validate, total),
+        ('POST /user/refresh', user_refresh, total),
+        ('GET /user/get/', user_get, total),
+        ('POST /create', create, total),
+        ('POST /create token', create_token, total),
+        ('GET /reminder', get_reminder, total),
+        ('GET /reminder_name', get_reminder_name, total),
+        ('GET /reminders', get_all_reminders, total),
+        ('GET /reminders token', get_all_reminders_token, total),
+        ('GET /reminders/changes', get_reminder_changes, total),
+        ('GET /reminders/archived', get_archived_reminders, total),
+        ('PUT /update', update, total),
+        ('DELETE /delete', delete_reminder, total),
+        ('GET /admin/profiles', get_profiles, total),
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_workers(count: int, timeout: float = 60) -> tuple:
+    '''
+        Sobe count processos da aplicação, cada um em uma porta, e espera
+        todos responderem. Retorna os processos e as URLs base.
+    '''
+    import requests
+    from benchmark.server import STATS_PATH
+
+    workers = []
+    base_urls = []
+    for _ in range(count):
+        port = free_port()
+        workers.append(subprocess.Popen(
+            [sys.executable, '-m', 'benchmark.server', '--port', str(port)],
+            env = os.environ.copy()))
+        base_urls.append('http://127.0.0.1:%d' % port)
+    deadline = time.monotonic() + timeout
+    for worker, base_url in zip(workers, base_urls):
+        while True:
+            try:
+                requests.get(base_url + STATS_PATH, timeout = 1)
+                break
+            except requests.ConnectionError:
+                if worker.poll() is not None or time.monotonic() > deadline:
+                    stop_workers(workers)
+                    raise SystemExit('Worker da aplicação não iniciou.')
+                time.sleep(0.1)
+    return workers, base_urls
+
+
+def stop_workers(workers: list):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.wait()
+
+
+def worker_stats(base_urls: list) -> dict:
+    '''
+        Soma as queries e o RSS de todos os workers.
+    '''
+    import requests
+    from benchmark.server import STATS_PATH
+
+    stats = [requests.get(base_url + STATS_PATH).json() for base_url in base_urls]
+    return {'queries': sum(item['queries'] for item in stats),
+            'rss_kb': sum(item['rss_kb'] for item in stats)}
+
+
+def run_scenario(base_urls: list, factory, total: int, concurrency: int) -> dict:
+    '''
+        Executa `total` requisições de uma rota com concorrência fixa,
+        alternando entre os workers, e retorna as métricas da rota.
+    '''
+    import requests
+
+    local = threading.local()
+
+    def call(index):
+        spec = factory(index)
+        if spec is None:
+            return None
+        if not hasattr(local, 'http'):
+            local.http = requests.Session()
+        collect = spec.pop('collect', None)
+        method = spec.pop('method')
+        url = base_urls[index % len(base_urls)] + spec.pop('path')
+        start = time.perf_counter()
+        response = local.http.request(method, url, **spec)
+        elapsed = time.perf_counter() - start
+        if collect and response.status_code == 200:
+            ids, lock, username = collect
+            with lock:
+                ids.append((username, response.json()['id']))
+        return elapsed, response.status_code
+
+    before = worker_stats(base_urls)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        results = [result for result in executor.map(call, range(total)) if result]
+    wall = time.perf_counter() - started
+    after = worker_stats(base_urls)
+
+    latencies = sorted(elapsed for elapsed, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    done = len(results)
+    return {
+        'requests': done,
+        'errors': errors,
+        'throughput_rps': round(done / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'db_queries_per_request': round((after['queries'] - before['queries']) / done, 2) if done else 0.0,
+        'rss_kb': after['rss_kb'],
+        'rss_delta_kb': after['rss_kb'] - before['rss_kb'],
+    }
+
+
+def compare(current: dict, baseline: dict) -> list:
+    '''
+        Compara dois resultados e retorna linhas legíveis com a variação
+        de p95, throughput e queries por requisição.
+    '''
+    lines = []
+    for route, metrics in current['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        lines.append('%-22s p95 %8.2fms -> %8.2fms | rps %8.2f -> %8.2f | queries %5.2f -> %5.2f' % (
+            route,
+            previous['latency_ms']['p95'], metrics['latency_ms']['p95'],
+            previous['throughput_rps'], metrics['throughput_rps'],
+            previous['db_queries_per_request'], metrics['db_queries_per_request']))
+    return lines
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark das rotas da api1.')
+    parser.add_argument('--users', type = int, default = 10)
+    parser.add_argument('--reminders', type = int, default = 20)
+    parser.add_argument('--requests', type = int, default = 200,
+                        help = 'requisições por rota')
+    parser.add_argument('--concurrency', type = int, default = 8)
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'processos da aplicação')
+    parser.add_argument('--shards', type = int, default = 0,
+                        help = 'número de shards de lembretes (0 desliga)')
+    parser.add_argument('--routes', nargs = '+', default = None,
+                        help = 'rotas a executar, pelo nome do cenário (padrão: todas)')
+    parser.add_argument('--output', default = None,
+                        help = 'arquivo JSON de saída (padrão: benchmark/results/<commit>.json)')
+    parser.add_argument('--compare', default = None,
+                        help = 'arquivo JSON de um resultado anterior para comparação')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix = 'api1-bench-')
+    fake_api2 = start_fake_api2()
+    os.environ['DB_PATH'] = workdir
+    os.environ['DB_URL'] = 'sqlite:///%s/db.sqlite3' % workdir
+    os.environ['SHARD_COUNT'] = str(args.shards)
+    os.environ['API2_URL'] = 'http://%s:%d' % fake_api2.server_address
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    os.environ['SECRET_KEY'] = secrets.token_hex(32)
+    # só as requisições de /admin/profiles enviam o token, as demais não são perfiladas
+    os.environ['PROFILE_ADMIN_TOKEN'] = secrets.token_hex(16)
+
+    # o processo de carga só popula o banco; a aplicação roda nos workers
+    from archive import archive_expired
+
+    seeded, tokens = seed(args.users, args.reminders, os.environ['SECRET_KEY'])
+    archive_expired()
+
+    workers, base_urls = start_workers(args.workers)
+    routes = {}
+    try:
+        for route, factory, total in build_scenarios(seeded, tokens, args.requests):
+            if args.routes and route not in args.routes:
+                continue
+            routes[route] = run_scenario(base_urls, factory, total, args.concurrency)
+            print('%-22s %s' % (route, json.dumps(routes[route])))
+    finally:
+        stop_workers(workers)
+        fake_api2.shutdown()
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'users': args.users,
+            'reminders_per_user': args.reminders,
+            'requests_per_route': args.requests,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'shards': args.shards,
+            'routes': args.routes,
+        },
+        'api2_prepare_calls': FakePrepareHandler.received,
+        'routes': routes,
+    }
+
+    output = args.output or os.path.join(RESULTS_PATH, '%s.json' % result['commit'])
+    os.makedirs(os.path.dirname(output) or '.', exist_ok = True)
+    with open(output, 'w') as results_file:
+        json.dump(result, results_file, indent = 2, sort_keys = True)
+    print('Resultados salvos em %s' % output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            for line in compare(result, json.load(baseline_file)):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+    Module responsible for running the application as a benchmark worker.
+
+    Cada worker é um processo separado do gerador de carga, para que as
+    latências, o RSS e as queries medidas sejam só da aplicação. Iniciado
+    por benchmark.run, com o ambiente (banco, shards, chaves) já definido:
+        python -m benchmark.server --port 5000
+'''
+import argparse
+import json
+
+from benchmark.run import QueryCounter, current_rss_kb
+
+STATS_PATH = '/__benchmark__/stats'
+
+
+class StatsMiddleware:
+    '''
+        Responde em STATS_PATH com as queries executadas e o RSS do
+        processo; as demais requisições seguem para a aplicação.
+    '''
+    def __init__(self, wsgi_app, counter: QueryCounter):
+        self.wsgi_app = wsgi_app
+        self.counter = counter
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') != STATS_PATH:
+            return self.wsgi_app(environ, start_response)
+        body = json.dumps({'queries': self.counter.count, 'rss_kb': current_rss_kb()})
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [body.encode('utf-8')]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Worker da api1 para o benchmark.')
+    parser.add_argument('--port', type = int, required = True)
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+    from model import engine, shard_engines
+    from app import app
+
+    counter = QueryCounter()
+    for counted_engine in [engine] + shard_engines:
+        event.listen(counted_engine, 'before_cursor_execute', counter)
+    server = make_server('127.0.0.1', args.port, StatsMiddleware(app, counter),
+                         threaded = True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
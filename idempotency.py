@@ -0,0 +1,55 @@
+'''Module responsible for storing and replaying responses of idempotent requests'''
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+
+from sqlalchemy.dialects.sqlite import insert
+from model import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+
+
+def request_fingerprint(form: dict) -> str:
+    '''
+        Gera o hash dos parâmetros da requisição, para detectar a mesma
+        chave reutilizada com outro conteúdo. O conteúdo é serializado em
+        JSON, para que valores com '&' ou '=' não se confundam com outros
+        campos.
+    '''
+    content = json.dumps(form, sort_keys = True, default = str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def find_response(session, user_id: int, key: str):
+    '''
+        Retorna a resposta salva para a chave do usuário, se ainda válida.
+    '''
+    return session.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > datetime.now()
+        ).first()
+
+
+def save_response(session, user_id: int, key: str, fingerprint: str,
+                  status: int, response: str) -> bool:
+    '''
+        Grava a resposta da chave na transação da sessão, sem commit, e
+        remove as chaves expiradas. Deve ser chamada na mesma transação da
+        gravação do lembrete, para que a chave só exista se o lembrete
+        existir. Retorna False se uma requisição concorrente já gravou a
+        chave; nesse caso a transação deve ser desfeita.
+    '''
+    now = datetime.now()
+    session.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= now).delete()
+    statement = insert(IdempotencyKey).values(
+        user_id = user_id,
+        key = key,
+        fingerprint = fingerprint,
+        status = status,
+        response = response,
+        expires_at = now + timedelta(seconds = IDEMPOTENCY_TTL)
+    ).on_conflict_do_nothing(index_elements = ['user_id', 'key'])
+    return bool(session.execute(statement).rowcount)
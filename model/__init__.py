@@ -1,24 +1,40 @@
 '''Module responsible for initializing the database'''
 import os
 from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 
 from model.base import Base
-from model.email import Email
 from model.user import User
 from model.reminder import Reminder
+from model.idempotency_key import IdempotencyKey
+from model.reminder_change import ReminderChange
+from model.archived_reminder import ArchivedReminder
+from model.reminder_id_range import ReminderIdRange
+from model.change_retention import ChangeRetention
+from model.migration import migrate_email_inline, migrate_reminder_name_per_user, \
+                            migrate_reminder_autoincrement, migrate_reminder_change_autoincrement
+from model.shard import ShardedSessionFactory, SHARD_COUNT, create_shard_engine, \
+                        next_reminder_id
 
-DB_PATH = 'database/'
+DB_PATH = os.environ.get('DB_PATH', 'database/')
 if not os.path.exists(DB_PATH):
     os.makedirs(DB_PATH)
 
-DB_URL = 'sqlite:///%s/db.sqlite3' % DB_PATH
+DB_URL = os.environ.get('DB_URL', 'sqlite:///%s/db.sqlite3' % DB_PATH)
 engine = create_engine(DB_URL, echo = False)
 
-Session = sessionmaker(bind = engine)
-
 if not database_exists(engine.url):
     create_database(engine.url)
 
 Base.metadata.create_all(engine)
+migrate_email_inline(engine)
+migrate_reminder_name_per_user(engine)
+migrate_reminder_autoincrement(engine)
+migrate_reminder_change_autoincrement(engine)
+
+# Com SHARD_COUNT > 1, Session(user_id) aponta as tabelas de lembretes para o
+# shard do usuário; Session() continua no banco principal.
+shard_engines = []
+if SHARD_COUNT > 1:
+    shard_engines = [create_shard_engine(DB_PATH, index) for index in range(SHARD_COUNT)]
+Session = ShardedSessionFactory(engine, shard_engines)
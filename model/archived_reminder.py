@@ -0,0 +1,24 @@
+'''Module responsible for archived reminder model'''
+from sqlalchemy import Column, String, Integer, DateTime, Boolean
+from model import Base
+
+
+class ArchivedReminder(Base):
+    '''
+        Class representing a reminder moved out of the reminders table by
+        the archival job. Same columns as Reminder, plus archived_at.
+    '''
+    __tablename__ = 'reminders_archive'
+
+    id = Column('pk_reminder', Integer, primary_key = True, autoincrement = False)
+    name = Column(String(60))
+    name_normalized = Column(String(140))
+    description = Column(String(255))
+    email = Column(String(60))
+    due_date = Column(DateTime)
+    send_email = Column(Boolean, default = False)
+    recurring = Column(Boolean, default = False)
+    user_id = Column(Integer, nullable = False, index = True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable = False)
@@ -0,0 +1,15 @@
+'''Module responsible for the reminder change log retention model'''
+from sqlalchemy import Column, Integer
+from model import Base
+
+
+class ChangeRetention(Base):
+    '''
+        Class representing the highest change seq of an user already removed
+        from the change log by the retention job. A client whose since is
+        below it has missed changes and must resync.
+    '''
+    __tablename__ = 'reminder_change_retention'
+
+    user_id = Column(Integer, primary_key = True, autoincrement = False)
+    pruned_seq = Column(Integer, nullable = False)
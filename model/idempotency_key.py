@@ -0,0 +1,30 @@
+'''Module responsible for idempotency key model'''
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from model import Base
+
+
+class IdempotencyKey(Base):
+    '''Class representing the stored response of an idempotent request'''
+    __tablename__ = 'idempotency_keys'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key = True)
+    key = Column(String(255), primary_key = True)
+    fingerprint = Column(String(64), nullable = False)
+    status = Column(Integer, nullable = False)
+    response = Column(Text, nullable = False)
+    expires_at = Column(DateTime, nullable = False, index = True)
+
+    def __init__(
+        self,
+        user_id: int,
+        key: str,
+        fingerprint: str,
+        status: int,
+        response: str,
+        expires_at: DateTime):
+        self.user_id = user_id
+        self.key = key
+        self.fingerprint = fingerprint
+        self.status = status
+        self.response = response
+        self.expires_at = expires_at
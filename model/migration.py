@@ -0,0 +1,130 @@
+'''Module responsible for migrating existing databases to the current schema'''
+from sqlalchemy import inspect, text
+from logger import logger
+
+
+def migrate_email_inline(engine):
+    '''
+        Move o email de cada lembrete da antiga tabela emails para a coluna
+        reminders.email e remove a tabela emails. Bancos novos já são
+        criados com a coluna e não são alterados.
+    '''
+    inspector = inspect(engine)
+    columns = [column['name'] for column in inspector.get_columns('reminders')]
+    has_emails_table = 'emails' in inspector.get_table_names()
+    if 'email' in columns and not has_emails_table:
+        return
+
+    with engine.begin() as connection:
+        if 'email' not in columns:
+            connection.execute(text('ALTER TABLE reminders ADD COLUMN email VARCHAR(60)'))
+        if has_emails_table:
+            connection.execute(text(
+                'UPDATE reminders SET email = ('
+                'SELECT emails.email FROM emails '
+                'WHERE emails.reminder = reminders.pk_reminder '
+                'ORDER BY emails.id LIMIT 1) '
+                'WHERE email IS NULL'))
+            connection.execute(text('DROP TABLE emails'))
+    logger.info('Emails dos lembretes migrados para a tabela reminders.')
+
+
+def migrate_reminder_name_per_user(engine):
+    '''
+        Troca a unicidade global de reminders.name pela unicidade por
+        usuário (user_id, name). O SQLite não remove constraints com ALTER
+        TABLE, então a tabela é recriada e os dados copiados.
+    '''
+    inspector = inspect(engine)
+    unique_columns = [constraint['column_names']
+                      for constraint in inspector.get_unique_constraints('reminders')]
+    if ['name'] not in unique_columns:
+        return
+
+    _rebuild_reminders(engine)
+    logger.info('Unicidade do nome dos lembretes migrada para (user_id, name).')
+
+
+def migrate_reminder_autoincrement(engine):
+    '''
+        Recria a tabela reminders com AUTOINCREMENT. Sem ele, o SQLite usa
+        max(id) + 1 e reaproveita o id de um lembrete removido ou arquivado,
+        que então colide com o id já salvo em reminders_archive.
+    '''
+    with engine.connect() as connection:
+        sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reminders'")).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+
+    _rebuild_reminders(engine)
+    logger.info('Tabela reminders recriada com AUTOINCREMENT.')
+
+
+def migrate_reminder_change_autoincrement(engine):
+    '''
+        Recria a tabela reminder_changes com AUTOINCREMENT. Sem ele, se a
+        retenção remover todas as alterações, o seq volta a 1 e fica abaixo
+        do seq que os clientes já viram. A sequência começa acima do maior
+        seq usado, inclusive os já removidos.
+    '''
+    from model.reminder_change import ReminderChange
+
+    with engine.connect() as connection:
+        sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'reminder_changes'")).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+
+    columns = ', '.join(column.name for column in ReminderChange.__table__.columns)
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE reminder_changes RENAME TO reminder_changes_old'))
+        for index in ReminderChange.__table__.indexes:
+            connection.execute(text('DROP INDEX IF EXISTS %s' % index.name))
+        ReminderChange.__table__.create(connection)
+        connection.execute(text(
+            'INSERT INTO reminder_changes (%s) SELECT %s FROM reminder_changes_old'
+            % (columns, columns)))
+        connection.execute(text('DROP TABLE reminder_changes_old'))
+
+        used_seqs = ['SELECT MAX(seq) AS seq FROM reminder_changes']
+        if 'reminder_change_retention' in inspect(connection).get_table_names():
+            used_seqs.append('SELECT MAX(pruned_seq) AS seq FROM reminder_change_retention')
+        last_seq = connection.execute(text(
+            'SELECT MAX(seq) FROM (%s)' % ' UNION ALL '.join(used_seqs))).scalar()
+        if last_seq is not None:
+            connection.execute(text(
+                "DELETE FROM sqlite_sequence WHERE name = 'reminder_changes'"))
+            connection.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('reminder_changes', :seq)"),
+                {'seq': last_seq})
+    logger.info('Tabela reminder_changes recriada com AUTOINCREMENT.')
+
+
+def _rebuild_reminders(engine):
+    '''
+        Recria a tabela reminders com o schema atual, copiando os dados. O
+        SQLite não altera constraints com ALTER TABLE. A sequência do
+        AUTOINCREMENT começa acima de todo id já usado, inclusive os arquivados.
+    '''
+    from model.reminder import Reminder
+
+    columns = ', '.join(column.name for column in Reminder.__table__.columns)
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE reminders RENAME TO reminders_old'))
+        Reminder.__table__.create(connection)
+        connection.execute(text(
+            'INSERT INTO reminders (%s) SELECT %s FROM reminders_old' % (columns, columns)))
+        connection.execute(text('DROP TABLE reminders_old'))
+
+        used_ids = ['SELECT MAX(pk_reminder) AS id FROM reminders']
+        if 'reminders_archive' in inspect(connection).get_table_names():
+            used_ids.append('SELECT MAX(pk_reminder) AS id FROM reminders_archive')
+        last_id = connection.execute(text(
+            'SELECT MAX(id) FROM (%s)' % ' UNION ALL '.join(used_ids))).scalar()
+        if last_id is not None:
+            connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'reminders'"))
+            connection.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('reminders', :seq)"),
+                {'seq': last_id})
@@ -1,29 +1,33 @@
 '''Module responsible for reminder model'''
 from typing import Union
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, \
+                       UniqueConstraint
 from unidecode import unidecode
 from model import Base
-from model import Email
 from model import User
 from logger import logger
 
 class Reminder(Base):
     '''Class representing a reminder'''
     __tablename__ = 'reminders'
+    # o nome é único por usuário, não globalmente
+    # AUTOINCREMENT impede que o id de um lembrete removido ou arquivado
+    # seja reaproveitado
+    __table_args__ = (
+        UniqueConstraint('user_id', 'name', name = 'uq_reminders_user_name'),
+        {'sqlite_autoincrement': True})
     id = Column('pk_reminder', Integer, primary_key = True)
-    name = Column(String(60), unique = True)
+    name = Column(String(60))
     name_normalized = Column(String(140))
     description = Column(String(255))
+    email = Column(String(60))
     due_date = Column(DateTime)
     send_email = Column(Boolean, unique = False, default = False)
     recurring = Column(Boolean, unique = False, default = False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable = False)
     created_at = Column(DateTime, default = datetime.now())
     updated_at = Column(DateTime, default = None)
-    # relationship with table email
-    email_relationship = relationship('Email')
     def __init__(
         self,
         name: str,
@@ -32,6 +36,7 @@ class Reminder(Base):
         due_date: Union[DateTime, None] = None,
         send_email: bool = False,
         recurring: bool = False,
+        email: Union[str, None] = None,
         created_at: Union[DateTime, None] = None,
         updated_at: Union[DateTime, None] = None):
         self.name = name
@@ -41,24 +46,70 @@ class Reminder(Base):
         self.due_date = due_date
         self.send_email = send_email
         self.recurring = recurring
+        self.email = email
 
         if not created_at:
             self.created_at = created_at
         if not updated_at:
             self.updated_at = updated_at
 
-    def insert_email(self, email:Email):
+    def insert_values(self) -> dict:
         '''
-            Adiciona um email a um lembrete.
+            Retorna os valores das colunas para um INSERT direto na tabela.
         '''
-        self.email_relationship.append(email)
+        return {
+            'name': self.name,
+            'name_normalized': self.name_normalized,
+            'description': self.description,
+            'email': self.email,
+            'due_date': self.due_date,
+            'send_email': self.send_email,
+            'recurring': self.recurring,
+            'user_id': self.user_id,
+            'created_at': datetime.now(),
+        }
+
+    def changed_values(
+        self,
+        name: Union[str, None] = None,
+        description: Union[str, None] = None,
+        due_date: Union[DateTime, None] = None,
+        send_email: Union[bool, None] = None,
+        email: Union[str, None] = None,
+        recurring: Union[bool, None] = None) -> dict:
+        '''
+            Retorna apenas as colunas cujo novo valor difere do atual.
+            None significa que o campo não foi enviado.
+        '''
+        values = {}
+        if name is not None and name != self.name:
+            values['name'] = name
+            values['name_normalized'] = unidecode(name.lower())
+        candidates = {
+            'description': description,
+            'due_date': due_date,
+            'send_email': send_email,
+            'email': email,
+            'recurring': recurring,
+        }
+        for column, value in candidates.items():
+            if value is not None and value != getattr(self, column):
+                values[column] = value
+        return values
+
+    def version(self) -> str:
+        '''
+            Versão do lembrete usada nos cabeçalhos ETag e If-Match:
+            o updated_at, ou '0' se nunca foi atualizado.
+        '''
+        return self.updated_at.isoformat() if self.updated_at else '0'
 
     def validate_email_before_send(self) -> bool:
         '''
             Function to validate if send_email is True, and if there is
             an email related to the reminder.
         '''
-        if self.send_email and self.email_relationship[0].email:
+        if self.send_email and self.email:
             return True
         return False
 
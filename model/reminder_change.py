@@ -0,0 +1,45 @@
+'''Module responsible for reminder change log model'''
+from datetime import datetime
+import json
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from model import Base
+
+
+class ReminderChange(Base):
+    '''Class representing a change made to a reminder of an user'''
+    __tablename__ = 'reminder_changes'
+    # AUTOINCREMENT: um seq nunca volta a ser usado, mesmo após a retenção
+    # remover as alterações mais recentes
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # sequência monotônica, usada pelos clientes no parâmetro since
+    seq = Column(Integer, primary_key = True, autoincrement = True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable = False, index = True)
+    reminder_id = Column(Integer, nullable = False)
+    operation = Column(String(10), nullable = False)
+    reminder = Column(Text)
+    created_at = Column(DateTime, default = datetime.now)
+
+    def __init__(
+        self,
+        user_id: int,
+        reminder_id: int,
+        operation: str,
+        reminder: str = None):
+        '''
+            Registra uma alteração (create, update, delete ou archive) de um
+            lembrete. reminder é o lembrete já serializado em JSON, ou None
+            na remoção e no arquivamento.
+        '''
+        self.user_id = user_id
+        self.reminder_id = reminder_id
+        self.operation = operation
+        self.reminder = reminder
+
+    def to_dict(self) -> dict:
+        return {
+            'seq': self.seq,
+            'operation': self.operation,
+            'reminder_id': self.reminder_id,
+            'reminder': json.loads(self.reminder) if self.reminder else None
+        }
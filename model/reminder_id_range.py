@@ -0,0 +1,15 @@
+'''Module responsible for the reminder id range model used by the shards'''
+from sqlalchemy import Column, Integer
+from model import Base
+
+
+class ReminderIdRange(Base):
+    '''
+        Class representing the last reminder id allocated to an user in
+        sharded mode. Ids are never reused, even after the reminder with the
+        highest id is deleted or archived.
+    '''
+    __tablename__ = 'reminder_id_ranges'
+
+    user_id = Column(Integer, primary_key = True, autoincrement = False)
+    last_id = Column(Integer, nullable = False)
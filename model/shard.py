@@ -0,0 +1,254 @@
+'''
+    Module responsible for the optional sharding of reminder storage by user.
+
+    Com SHARD_COUNT maior que 1, os lembretes, o log de alterações (e a sua
+    retenção), os
+    lembretes arquivados e as chaves de idempotência de cada usuário ficam
+    no arquivo database/shard_<user_id % SHARD_COUNT>.sqlite3, para que a
+    chave seja gravada na mesma transação do lembrete. Os usuários
+    continuam no banco principal.
+
+    Rebalanceamento (com a aplicação parada, após mudar SHARD_COUNT):
+        SHARD_COUNT=4 python -m model.shard
+'''
+import glob
+import os
+import re
+import threading
+
+from sqlalchemy import create_engine, inspect, select, func, text
+from sqlalchemy.orm import sessionmaker
+
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '0'))
+SHARD_URL = 'sqlite:///%s/shard_%d.sqlite3'
+# Cada usuário recebe uma faixa própria de ids de lembrete, para que os ids
+# sejam únicos entre os shards e não mudem ao mover o usuário de shard.
+REMINDER_ID_SPAN = 2 ** 20
+
+
+def sharded_tables() -> list:
+    '''
+        Tabelas que ficam nos shards, em ordem de criação.
+    '''
+    from model.reminder import Reminder
+    from model.reminder_change import ReminderChange
+    from model.archived_reminder import ArchivedReminder
+    from model.reminder_id_range import ReminderIdRange
+    from model.idempotency_key import IdempotencyKey
+    from model.change_retention import ChangeRetention
+    return [Reminder.__table__, ReminderChange.__table__, ArchivedReminder.__table__,
+            ReminderIdRange.__table__, IdempotencyKey.__table__, ChangeRetention.__table__]
+
+
+def create_shard_engine(db_path: str, index: int):
+    '''
+        Cria o engine de um shard e as suas tabelas, se necessário.
+    '''
+    from model.base import Base
+    from model.migration import migrate_reminder_autoincrement, \
+                                migrate_reminder_change_autoincrement
+
+    shard_engine = create_engine(SHARD_URL % (db_path, index), echo = False)
+    Base.metadata.create_all(shard_engine, tables = sharded_tables())
+    migrate_reminder_autoincrement(shard_engine)
+    migrate_reminder_change_autoincrement(shard_engine)
+    create_reminder_id_trigger(shard_engine)
+    return shard_engine
+
+
+class ShardedSessionFactory:
+    '''
+        Factory de sessões que substitui o sessionmaker. Session() abre uma
+        sessão no banco principal; Session(user_id) abre uma sessão em que
+        as tabelas de lembretes apontam para o shard do usuário. Sem shards,
+        as duas formas usam o banco principal.
+        As sessões abertas em cada thread são guardadas até remove(), que
+        as fecha e devolve as conexões ao pool.
+    '''
+    def __init__(self, engine, shard_engines: list):
+        self.engine = engine
+        self.shard_engines = shard_engines
+        self.local = threading.local()
+        self.default = sessionmaker(bind = engine)
+        self.shards = [
+            sessionmaker(bind = engine,
+                         binds = {table: shard_engine for table in sharded_tables()})
+            for shard_engine in shard_engines
+        ]
+
+    def __call__(self, user_id: int = None):
+        if user_id is None or not self.shards:
+            session = self.default()
+        else:
+            session = self.shards[shard_for(user_id, len(self.shards))]()
+        if not hasattr(self.local, 'sessions'):
+            self.local.sessions = []
+        self.local.sessions.append(session)
+        return session
+
+    def remove(self):
+        '''
+            Fecha as sessões abertas pela thread atual.
+        '''
+        sessions = getattr(self.local, 'sessions', [])
+        self.local.sessions = []
+        for session in sessions:
+            session.close()
+
+    def reminder_engines(self) -> list:
+        '''
+            Engines que guardam lembretes: os shards, ou o banco principal.
+        '''
+        return self.shard_engines or [self.engine]
+
+
+def shard_for(user_id: int, shard_count: int) -> int:
+    return user_id % shard_count
+
+
+def next_reminder_id(user_id: int):
+    '''
+        Expressão SQL do próximo id da faixa do usuário, calculada dentro do
+        próprio INSERT do lembrete: parte do último id gravado em
+        reminder_id_ranges, que o gatilho do shard mantém, e, sem ele, do
+        maior id já existente na faixa. Assim um id nunca é reaproveitado,
+        mesmo após remover ou arquivar o lembrete de maior id, sem uma
+        escrita a mais por lembrete. Usada apenas com shards.
+    '''
+    from model.reminder import Reminder
+    from model.reminder_id_range import ReminderIdRange
+
+    reminders = Reminder.__table__
+    ranges = ReminderIdRange.__table__
+    first_id = user_id * REMINDER_ID_SPAN
+    last_id = select(ranges.c.last_id).where(ranges.c.user_id == user_id).scalar_subquery()
+    current = select(func.max(reminders.c.pk_reminder)).where(
+        reminders.c.pk_reminder > first_id,
+        reminders.c.pk_reminder < first_id + REMINDER_ID_SPAN
+    ).scalar_subquery()
+    return func.coalesce(last_id, current, first_id) + 1
+
+
+def create_reminder_id_trigger(shard_engine):
+    '''
+        Cria no shard o gatilho que, a cada lembrete inserido, guarda o
+        último id da faixa do usuário em reminder_id_ranges e aborta o
+        INSERT quando a faixa de REMINDER_ID_SPAN ids se esgota.
+    '''
+    with shard_engine.begin() as connection:
+        connection.execute(text('''
+            CREATE TRIGGER IF NOT EXISTS reminder_id_range_insert
+            AFTER INSERT ON reminders
+            BEGIN
+                SELECT RAISE(ABORT, 'faixa de ids do usuário esgotada')
+                 WHERE NEW.pk_reminder >= (NEW.user_id + 1) * %(span)d;
+                INSERT INTO reminder_id_ranges (user_id, last_id)
+                SELECT NEW.user_id, NEW.pk_reminder
+                 WHERE NEW.pk_reminder > NEW.user_id * %(span)d
+                ON CONFLICT (user_id) DO UPDATE
+                   SET last_id = max(last_id, excluded.last_id);
+            END
+        ''' % {'span': REMINDER_ID_SPAN}))
+
+
+def _existing_shard_urls(db_path: str) -> list:
+    indexes = []
+    for path in glob.glob(os.path.join(db_path, 'shard_*.sqlite3')):
+        match = re.search(r'shard_(\d+)\.sqlite3$', path)
+        if match:
+            indexes.append(int(match.group(1)))
+    return [SHARD_URL % (db_path, index) for index in sorted(indexes)]
+
+
+def _copy_rows(source, target, table, user_id: int):
+    rows = source.execute(
+        select(table).where(table.c.user_id == user_id)).mappings().all()
+    if rows:
+        target.execute(table.insert(), [dict(row) for row in rows])
+    return len(rows)
+
+
+def _move_changes(source, target, table, user_id: int):
+    '''
+        Move o log de alterações do usuário renumerando a sequência acima
+        de qualquer seq que o cliente já possa ter visto, na mesma ordem.
+        O cliente recebe o histórico de novo, o que é seguro, pois cada
+        alteração traz o estado completo do lembrete.
+    '''
+    rows = source.execute(
+        select(table).where(table.c.user_id == user_id).order_by(table.c.seq)
+    ).mappings().all()
+    if not rows:
+        return 0
+    target_max = target.execute(select(func.max(table.c.seq))).scalar() or 0
+    base = max(target_max, rows[-1]['seq'])
+    moved = []
+    for position, row in enumerate(rows, start = 1):
+        row = dict(row)
+        row['seq'] = base + position
+        moved.append(row)
+    target.execute(table.insert(), moved)
+    return len(moved)
+
+
+def rebalance(db_path: str, main_engine, shard_count: int) -> dict:
+    '''
+        Move os dados de cada usuário para o shard user_id % shard_count,
+        lendo o banco principal (dados de antes do sharding) e todos os
+        arquivos de shard existentes. Cada usuário é movido em uma
+        transação por arquivo de origem e destino.
+        Retorna quantos usuários foram movidos.
+    '''
+    from model.reminder import Reminder
+    from model.reminder_change import ReminderChange
+    from model.archived_reminder import ArchivedReminder
+    from model.reminder_id_range import ReminderIdRange
+    from model.idempotency_key import IdempotencyKey
+    from model.change_retention import ChangeRetention
+
+    targets = [create_shard_engine(db_path, index) for index in range(shard_count)]
+    target_urls = {str(target.url): target for target in targets}
+    sources = [main_engine] + [
+        target_urls.get(url) or create_engine(url) for url in _existing_shard_urls(db_path)]
+
+    moved_users = 0
+    for source_engine in sources:
+        source_tables = inspect(source_engine).get_table_names()
+        existing = [table.name for table in sharded_tables() if table.name in source_tables]
+        if Reminder.__tablename__ not in existing:
+            continue
+        user_ids = set()
+        with source_engine.connect() as connection:
+            for name in existing:
+                user_ids.update(connection.execute(
+                    text('SELECT DISTINCT user_id FROM %s' % name)).scalars().all())
+
+        for user_id in sorted(user_ids):
+            target_engine = targets[shard_for(user_id, shard_count)]
+            if target_engine.url == source_engine.url:
+                continue
+            with source_engine.begin() as source, target_engine.begin() as target:
+                # as faixas vão antes dos lembretes, cujo gatilho as atualiza
+                for table in (ReminderIdRange.__table__, Reminder.__table__,
+                              ArchivedReminder.__table__, IdempotencyKey.__table__,
+                              ChangeRetention.__table__):
+                    if table.name in existing:
+                        _copy_rows(source, target, table, user_id)
+                        source.execute(table.delete().where(table.c.user_id == user_id))
+                if ReminderChange.__tablename__ in existing:
+                    changes = ReminderChange.__table__
+                    _move_changes(source, target, changes, user_id)
+                    source.execute(changes.delete().where(changes.c.user_id == user_id))
+            moved_users += 1
+    return {'moved_users': moved_users, 'shards': shard_count}
+
+
+if __name__ == '__main__':
+    from model import engine, DB_PATH
+    from logger import logger
+
+    if SHARD_COUNT < 2:
+        raise SystemExit('Defina SHARD_COUNT maior que 1 para rebalancear.')
+    result = rebalance(DB_PATH, engine, SHARD_COUNT)
+    logger.info('Rebalanceamento concluído: %s', result)
+    print(result)
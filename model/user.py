@@ -4,6 +4,7 @@ from sqlalchemy import Column, String, Integer, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from model import Base
+import hashlib
 import bcrypt
 
 class User(Base):
@@ -45,6 +46,13 @@ class User(Base):
 
         return bcrypt.checkpw(bytes, hashed_password_bytes)
 
+    def password_version(self) -> str:
+        '''
+            Identifica o hash de senha atual. Muda sempre que a senha muda,
+            invalidando os tokens emitidos antes da troca.
+        '''
+        return hashlib.sha256(self.password_hash.encode('utf-8')).hexdigest()[:12]
+
     def is_authenticated(self):
         return True
 
@@ -0,0 +1,157 @@
+'''Module responsible for the opt-in per-request profiling of the application'''
+from collections import Counter
+from io import StringIO
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from flask import request, g
+from logger import logger
+
+# Fração das requisições que serão perfiladas (0 desliga a amostragem).
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+# Token do cabeçalho de admin. Sem ele, nem o cabeçalho nem a rota de admin funcionam.
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+PROFILE_HEADER = 'X-Profile-Token'
+# Intervalo, em segundos, entre amostras de pilha usadas no flamegraph.
+PROFILE_STACK_INTERVAL = float(os.environ.get('PROFILE_STACK_INTERVAL', '0.005'))
+# Requisições sem rota (404) ficam todas sob a mesma chave, para que caminhos
+# arbitrários não criem uma entrada cada.
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class StackSampler(threading.Thread):
+    '''
+        Amostra periodicamente a pilha de uma thread e acumula as pilhas
+        no formato collapsed ("a;b;c contagem") usado pelos flamegraphs.
+    '''
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon = True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+class ProfileStore:
+    '''
+        Agrega, por rota, as estatísticas do cProfile e as pilhas amostradas.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.stacks = {}
+        self.requests = Counter()
+
+    def add(self, route: str, profile: cProfile.Profile, stacks: Counter):
+        with self.lock:
+            if route in self.stats:
+                self.stats[route].add(profile)
+            else:
+                self.stats[route] = pstats.Stats(profile)
+            self.stacks.setdefault(route, Counter()).update(stacks)
+            self.requests[route] += 1
+
+    def routes(self) -> dict:
+        with self.lock:
+            return dict(self.requests)
+
+    def pstats_text(self, route: str, limit: int = 40) -> str:
+        with self.lock:
+            stats = self.stats.get(route)
+            if stats is None:
+                return ''
+            stream = StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(limit)
+            return stream.getvalue()
+
+    def collapsed_text(self, route: str) -> str:
+        with self.lock:
+            stacks = self.stacks.get(route, Counter())
+            return '\n'.join('%s %d' % (stack, count) for stack, count in stacks.most_common())
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.stacks.clear()
+            self.requests.clear()
+
+
+profile_store = ProfileStore()
+
+
+def is_admin_request() -> bool:
+    '''
+        Valida se a requisição traz o token de admin de profiling.
+    '''
+    if not PROFILE_ADMIN_TOKEN:
+        return False
+    # compara bytes: compare_digest não aceita str com caracteres não ASCII
+    return hmac.compare_digest(request.headers.get(PROFILE_HEADER, '').encode('utf-8'),
+                               PROFILE_ADMIN_TOKEN.encode('utf-8'))
+
+
+def _start_profiling():
+    if not is_admin_request() and not (
+            PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Outro profiler já está ativo (ex.: requisição concorrente no Python 3.12+).
+        return
+    sampler = StackSampler(threading.get_ident(), PROFILE_STACK_INTERVAL)
+    sampler.start()
+    g.profiling = (profile, sampler, time.perf_counter())
+
+
+def _stop_profiling(exception = None):
+    profiling = g.pop('profiling', None)
+    if profiling is None:
+        return
+    profile, sampler, started = profiling
+    profile.disable()
+    stacks = sampler.stop()
+    rule = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    route = '%s %s' % (request.method, rule)
+    profile_store.add(route, profile, stacks)
+    logger.debug('Requisição perfilada %s em %.2fms', route, (time.perf_counter() - started) * 1000)
+
+
+def init_profiler(app):
+    '''
+        Registra os hooks de profiling na aplicação. Se a amostragem estiver
+        desligada e não houver token de admin, nenhum hook é registrado e o
+        custo por requisição é nulo.
+    '''
+    if not PROFILE_SAMPLE_RATE and not PROFILE_ADMIN_TOKEN:
+        return False
+    app.before_request(_start_profiling)
+    app.teardown_request(_stop_profiling)
+    logger.info('Profiling habilitado: amostragem %.4f, admin %s',
+                PROFILE_SAMPLE_RATE, 'sim' if PROFILE_ADMIN_TOKEN else 'não')
+    return True
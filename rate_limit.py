@@ -0,0 +1,207 @@
+'''Module responsible for the per-user and per-IP rate limiting (token bucket)'''
+from collections import OrderedDict
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from logger import logger
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# memory: um balde por processo. sqlite: baldes compartilhados entre os workers do host.
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', 'database/rate_limit.sqlite3')
+# Baldes cheios equivalem a baldes inexistentes e são removidos a cada
+# RATE_LIMIT_SWEEP_INTERVAL segundos. No backend memory, acima de
+# RATE_LIMIT_MAX_BUCKETS o balde usado há mais tempo é descartado.
+RATE_LIMIT_SWEEP_INTERVAL = float(os.environ.get('RATE_LIMIT_SWEEP_INTERVAL', '60'))
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '100000'))
+
+# Proxies reversos confiáveis à frente da aplicação. Sem eles, o IP de cada
+# requisição é o do proxy e todos os clientes dividem o mesmo balde; com
+# TRUSTED_PROXIES=N, o IP vem do cabeçalho X-Forwarded-For (ver app.py).
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+
+
+def parse_overrides(text: str) -> dict:
+    '''
+        Lê os limites da variável RATE_LIMITS, um JSON como
+        {"/create": "10/60", "default": "60/60"}. A chave "default" vale
+        para as rotas não listadas.
+    '''
+    return {None if route == 'default' else route: limit
+            for route, limit in json.loads(text).items()}
+
+
+# Limites por rota no formato 'capacidade/segundos'. A chave None é o padrão
+# das rotas não listadas. Podem ser sobrescritos pela variável RATE_LIMITS.
+ROUTE_LIMITS = {
+    None: '120/60',
+    '/user/create': '5/60',
+    '/user/validate': '10/60',
+    '/create': '30/60',
+    '/update': '30/60',
+    '/delete': '30/60',
+}
+ROUTE_LIMITS.update(parse_overrides(os.environ.get('RATE_LIMITS', '{}')))
+
+
+def parse_limit(limit: str) -> tuple:
+    '''
+        Converte 'capacidade/segundos' em (capacidade, tokens por segundo).
+    '''
+    capacity, period = limit.split('/')
+    capacity = float(capacity)
+    return capacity, capacity / float(period)
+
+
+def refill(tokens: float, updated: float, capacity: float, rate: float, now: float) -> tuple:
+    '''
+        Completa o balde pelo tempo decorrido e retira um token, se houver.
+        Retorna (tokens restantes, segundos até o próximo token, momento
+        em que o balde estará cheio de novo).
+    '''
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    retry_after = 0 if tokens >= 1 else (1 - tokens) / rate
+    if not retry_after:
+        tokens -= 1
+    return tokens, retry_after, now + (capacity - tokens) / rate
+
+
+class MemoryBackend:
+    '''
+        Baldes mantidos na memória do processo, do usado há mais tempo ao
+        mais recente.
+    '''
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+                 sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+        self.max_buckets = max_buckets
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0
+
+    def consume(self, key: str, capacity: float, rate: float, now: float) -> float:
+        '''
+            Retira um token do balde. Retorna 0 se a requisição for aceita,
+            ou quantos segundos faltam para o próximo token.
+        '''
+        with self.lock:
+            if now >= self.next_sweep:
+                self._sweep(now)
+            tokens, updated, _ = self.buckets.pop(key, (capacity, now, now))
+            tokens, retry_after, full_at = refill(tokens, updated, capacity, rate, now)
+            self.buckets[key] = (tokens, now, full_at)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last = False)
+            return retry_after
+
+    def _sweep(self, now: float):
+        for key in [key for key, bucket in self.buckets.items() if bucket[2] <= now]:
+            del self.buckets[key]
+        self.next_sweep = now + self.sweep_interval
+
+
+class SQLiteBackend:
+    '''
+        Baldes persistidos em um arquivo SQLite, compartilhados entre os
+        workers da mesma máquina. BEGIN IMMEDIATE garante a atomicidade
+        da leitura e escrita de cada balde entre processos. O arquivo usa WAL
+        e synchronous=NORMAL: o commit não espera um fsync, e uma queda do
+        host perde no máximo as últimas atualizações dos baldes.
+    '''
+    def __init__(self, path: str, sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0
+        self.local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'full_at REAL NOT NULL DEFAULT 0)')
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(buckets)')]
+        if 'full_at' not in columns:
+            connection.execute('ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+        connection.execute('CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, 'connection'):
+            connection = sqlite3.connect(self.path, timeout = 5, isolation_level = None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return self.local.connection
+
+    def consume(self, key: str, capacity: float, rate: float, now: float) -> float:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if now >= self.next_sweep:
+                connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+                self.next_sweep = now + self.sweep_interval
+            row = connection.execute(
+                'SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after, full_at = refill(tokens, updated, capacity, rate, now)
+            connection.execute(
+                'INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, '
+                'updated = excluded.updated, full_at = excluded.full_at',
+                (key, tokens, now, full_at))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    '''
+        Aplica um balde por IP e, se a requisição trouxer uma identidade
+        já verificada, outro por usuário em cada rota. O username de Basic
+        ou de ?username= não é verificado antes do limite, e usá-lo
+        permitiria esgotar o balde de outro usuário; sem identidade
+        verificada, vale só o balde do IP.
+    '''
+    def __init__(self, backend, limits: dict):
+        self.backend = backend
+        self.limits = {route: parse_limit(limit) for route, limit in limits.items()}
+
+    def check(self, request, user_id: int = None) -> int:
+        '''
+            Retorna 0 se a requisição pode seguir, ou o valor de Retry-After
+            em segundos. user_id deve vir de uma credencial já verificada.
+        '''
+        if request.url_rule is None:
+            return 0
+        route = request.url_rule.rule
+        capacity, rate = self.limits.get(route, self.limits[None])
+        now = time.time()
+
+        keys = ['ip:%s:%s' % (request.remote_addr, route)]
+        if user_id is not None:
+            keys.append('user:%d:%s' % (user_id, route))
+
+        retry_after = 0
+        for key in keys:
+            retry_after = max(retry_after, self.backend.consume(key, capacity, rate, now))
+        if retry_after:
+            logger.warning('Limite de requisições excedido em %s: %s', route, keys)
+        return math.ceil(retry_after)
+
+
+def create_rate_limiter():
+    '''
+        Cria o limitador conforme as variáveis de ambiente, ou None se
+        estiver desabilitado.
+    '''
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if RATE_LIMIT_BACKEND == 'sqlite':
+        backend = SQLiteBackend(RATE_LIMIT_DB)
+    else:
+        backend = MemoryBackend()
+    return RateLimiter(backend, ROUTE_LIMITS)
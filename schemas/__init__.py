@@ -4,8 +4,11 @@ from schemas.reminder import ReminderSchema, ReminderUpdateSchema, \
                             ReminderViewSchema, RemindersListSchema, \
                             ReminderSearchByNameSchema, \
                             show_reminder, show_reminders, RemindersSearchSchema, \
-                            ReminderCreateOrUpdateSchema
+                            ReminderCreateOrUpdateSchema, ReminderChangesSearchSchema, \
+                            ReminderChangeSchema, ReminderChangesListSchema, \
+                            RemindersArchivedSearchSchema
 from schemas.user import UserSchema, UserViewSchema, UserWithIdViewSchema, \
-                            UserSearchSchema
+                            UserSearchSchema, UserTokenViewSchema, UserRefreshSchema
 from schemas.send_email import SendEmailSchema
 from schemas.error import ErrorSchema
+from schemas.profile import ProfileSearchSchema, ProfileListSchema
@@ -0,0 +1,31 @@
+'''
+    Schema responsible for defining how the profiling admin route
+    parameters are validated and how its responses are displayed.
+'''
+from typing import Optional, Dict
+from pydantic import BaseModel, validator
+
+
+class ProfileSearchSchema(BaseModel):
+    '''
+        Define a busca dos perfis agregados de uma rota.
+        Sem rota, retorna a lista de rotas perfiladas.
+    '''
+    route: Optional[str] = None
+    format: str = 'pstats'
+    reset: Optional[bool] = False
+
+    @validator('format', allow_reuse = True)
+    def validator_format(cls, parameter):
+        '''Validator for format'''
+        if parameter not in ('pstats', 'collapsed'):
+            raise ValueError('O formato deve ser pstats ou collapsed!')
+        return parameter
+
+
+class ProfileListSchema(BaseModel):
+    '''
+        Define como será a listagem das rotas perfiladas e o número de
+        requisições agregadas em cada uma.
+    '''
+    routes: Dict[str, int]
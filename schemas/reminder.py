@@ -43,16 +43,16 @@ class ReminderSchema(BaseModel):
 
 class ReminderUpdateSchema(BaseModel):
     '''
-        Define como um lembrete a ser atualizado pode ser salvo.
+        Define como um lembrete a ser atualizado pode ser salvo. Apenas os
+        campos enviados são alterados.
     '''
     id: int = 1
-    name: Optional[str] = 'Ir no dentista'
-    description: Optional[str] = 'Marcar o retorno da consulta'
-    due_date: Optional[datetime] = '2023-10-20T00:00:00.000Z'
-    send_email: Optional[bool] = True
-    email: str = 'emaildeexemplo@email.com'
-    recurring: Optional[bool] = False
-    updated_at: datetime = datetime.now()
+    name: Optional[str] = None
+    description: Optional[str] = None
+    due_date: Optional[datetime] = None
+    send_email: Optional[bool] = None
+    email: Optional[str] = None
+    recurring: Optional[bool] = None
 
     @validator('name', allow_reuse = True)
     def validator_name(cls, parameter):
@@ -128,7 +128,7 @@ def show_reminder(reminder: Reminder):
         'description': reminder.description,
         'due_date': reminder.due_date,
         'send_email': reminder.send_email,
-        'email': reminder.email_relationship[0].email,
+        'email': reminder.email,
         'recurring': reminder.recurring,
         'user_id': reminder.user_id
     }
@@ -147,7 +147,7 @@ def show_reminders(reminders: List[Reminder]):
             'description': reminder.description,
             'due_date': reminder.due_date,
             'send_email': reminder.send_email,
-            'email': reminder.email_relationship[0].email,
+            'email': reminder.email,
             'recurring': reminder.recurring,
             'user_id': reminder.user_id
         })
@@ -161,8 +161,71 @@ class RemindersSearchSchema(BaseModel):
     username: str
 
 
+class RemindersArchivedSearchSchema(BaseModel):
+    '''
+        Define como será a busca paginada dos lembretes arquivados de um
+        usuário logado.
+    '''
+    username: str
+    limit: int = 100
+    offset: int = 0
+
+    @validator('limit', allow_reuse = True)
+    def validator_limit(cls, parameter):
+        '''Validator for limit'''
+        if parameter < 1 or parameter > 1000:
+            raise ValueError('O limite deve estar entre 1 e 1000!')
+        return parameter
+
+    @validator('offset', allow_reuse = True)
+    def validator_offset(cls, parameter):
+        '''Validator for offset'''
+        if parameter < 0:
+            raise ValueError('O deslocamento não pode ser negativo!')
+        return parameter
+
+
 class ReminderCreateOrUpdateSchema(BaseModel):
     '''
         Define o parâmetro para permitir a criação ou atualização de lembrete.
     '''
     username: str
+
+
+class ReminderChangesSearchSchema(BaseModel):
+    '''
+        Define a busca das alterações dos lembretes de um usuário a partir
+        de uma sequência.
+    '''
+    username: str
+    since: int = 0
+    limit: int = 100
+
+    @validator('limit', allow_reuse = True)
+    def validator_limit(cls, parameter):
+        '''Validator for limit'''
+        if parameter < 1 or parameter > 1000:
+            raise ValueError('O limite deve estar entre 1 e 1000!')
+        return parameter
+
+
+class ReminderChangeSchema(BaseModel):
+    '''
+        Define como será a visualização de uma alteração de lembrete.
+        Na remoção e no arquivamento, reminder é nulo.
+    '''
+    seq: int
+    operation: str
+    reminder_id: int
+    reminder: Optional[ReminderViewSchema]
+
+
+class ReminderChangesListSchema(BaseModel):
+    '''
+        Define como a listagem de alterações será retornada. Com resync
+        True, alterações já saíram do log: o cliente recarrega os lembretes
+        e continua a partir de last_seq.
+    '''
+    changes: List[ReminderChangeSchema]
+    last_seq: int
+    resync: bool
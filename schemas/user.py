@@ -2,6 +2,7 @@
     Schema responsible for defining how routes return messages are
     displayed and also for routes parameters validation.
 '''
+from typing import Optional
 from pydantic import BaseModel, validator
 from model.user import User
 import re
@@ -50,3 +51,22 @@ class UserSearchSchema(BaseModel):
         Define como será a busca de um user pelo username.
     '''
     username: str
+
+
+class UserTokenViewSchema(BaseModel):
+    '''
+        Define como será a visualização de um user validado, com os tokens
+        de acesso. expires_in é a validade do access token em segundos.
+        Os tokens são omitidos se a SECRET_KEY não estiver definida.
+    '''
+    username: str
+    access_token: Optional[str]
+    refresh_token: Optional[str]
+    expires_in: Optional[int]
+
+
+class UserRefreshSchema(BaseModel):
+    '''
+        Define os parâmetros para renovar os tokens de um user.
+    '''
+    refresh_token: str
@@ -0,0 +1,16 @@
+'''
+    Package responsible for the unit tests of the application.
+
+    Uso (na raiz do repositório):
+        python -m nose2 -v
+'''
+import os
+import tempfile
+
+# Os models criam o banco ao serem importados; os testes usam um banco
+# temporário, nunca o database/ da aplicação.
+TEST_DB_PATH = tempfile.mkdtemp(prefix = 'api1-tests-')
+os.environ['DB_PATH'] = TEST_DB_PATH
+os.environ['DB_URL'] = 'sqlite:///%s/db.sqlite3' % TEST_DB_PATH
+os.environ['SHARD_COUNT'] = '0'
+os.environ['SECRET_KEY'] = 'chave-dos-testes'
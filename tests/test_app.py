@@ -0,0 +1,24 @@
+'''Tests for the routes of the application'''
+import unittest
+
+import tests
+from app import app
+
+
+class MalformedTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_public_route_ignores_malformed_bearer(self):
+        response = self.client.get('/', headers = {'Authorization': 'Bearer é.é'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_protected_route_rejects_malformed_bearer(self):
+        response = self.client.get('/reminders', query_string = {'username': 'Ana'},
+                                   headers = {'Authorization': 'Bearer abc.déf'})
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
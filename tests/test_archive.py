@@ -0,0 +1,71 @@
+'''Tests for the archival of expired reminders'''
+from datetime import datetime, timedelta
+import os
+import unittest
+
+import tests
+from app import app
+from auth_token import issue_token
+from model import Session, engine, Reminder, ArchivedReminder, User
+from archive import archive_batch
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = Session()
+        self.user = User('Arquivo', 'senha-teste')
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.query(Reminder).filter(Reminder.user_id == self.user.id).delete()
+        self.session.query(ArchivedReminder).filter(
+            ArchivedReminder.user_id == self.user.id).delete()
+        self.session.delete(self.user)
+        self.session.commit()
+        self.session.close()
+
+    def add_reminder(self, name: str, due_date: datetime) -> int:
+        reminder = Reminder(name, 'descrição', self.user.id, due_date = due_date,
+                            email = 'teste@email.com')
+        self.session.add(reminder)
+        self.session.commit()
+        return reminder.id
+
+    def test_archived_id_is_never_reused(self):
+        yesterday = datetime.now() - timedelta(days = 1)
+        archived_id = self.add_reminder('Vencido', yesterday)
+        self.assertEqual(archive_batch(engine, datetime.now(), 10), 1)
+
+        new_id = self.add_reminder('Vencido de novo', yesterday)
+        self.assertGreater(new_id, archived_id)
+        self.assertEqual(archive_batch(engine, datetime.now(), 10), 1)
+        archived = self.session.query(ArchivedReminder).filter(
+            ArchivedReminder.user_id == self.user.id).count()
+        self.assertEqual(archived, 2)
+
+    def test_recurring_and_future_reminders_stay(self):
+        self.add_reminder('Futuro', datetime.now() + timedelta(days = 1))
+        recurring = Reminder('Recorrente', 'descrição', self.user.id,
+                             due_date = datetime.now() - timedelta(days = 1), recurring = True)
+        self.session.add(recurring)
+        self.session.commit()
+        self.assertEqual(archive_batch(engine, datetime.now(), 10), 0)
+
+    def test_archived_search_rejects_invalid_pagination(self):
+        headers = {'Authorization': 'Bearer %s' % issue_token(
+            os.environ['SECRET_KEY'], self.user, 'access')}
+        client = app.test_client()
+        for limit, offset in ((0, 0), (1001, 0), (-1, 0), (10, -1)):
+            response = client.get('/reminders/archived', headers = headers,
+                                  query_string = {'username': 'Arquivo', 'limit': limit,
+                                                  'offset': offset})
+            self.assertEqual(response.status_code, 422, (limit, offset))
+        response = client.get('/reminders/archived', headers = headers,
+                              query_string = {'username': 'Arquivo', 'limit': 1000})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''Tests for the signed access and refresh tokens'''
+import time
+import unittest
+from unittest import mock
+
+import auth_token
+from auth_token import issue_token, verify_token
+
+SECRET = 'chave-de-teste'
+
+
+class FakeUser:
+    '''Usuário mínimo com a interface usada por issue_token.'''
+    username = 'Maria'
+
+    def get_id(self):
+        return 7
+
+    def password_version(self):
+        return 'abc123'
+
+
+class AuthTokenTest(unittest.TestCase):
+
+    def test_issue_and_verify(self):
+        token = issue_token(SECRET, FakeUser(), 'access')
+        payload = verify_token(SECRET, token, 'access')
+        self.assertEqual(payload['uid'], 7)
+        self.assertEqual(payload['sub'], 'Maria')
+        self.assertEqual(payload['pwv'], 'abc123')
+
+    def test_wrong_secret_is_rejected(self):
+        token = issue_token(SECRET, FakeUser(), 'access')
+        self.assertIsNone(verify_token('outra-chave', token, 'access'))
+
+    def test_tampered_payload_is_rejected(self):
+        body, signature = issue_token(SECRET, FakeUser(), 'access').split('.')
+        forged = issue_token('outra-chave', FakeUser(), 'access').split('.')[0]
+        self.assertIsNone(verify_token(SECRET, '%s.%s' % (forged[:-1] + 'A', signature), 'access'))
+        self.assertIsNone(verify_token(SECRET, body, 'access'))
+        self.assertIsNone(verify_token(SECRET, None, 'access'))
+
+    def test_non_ascii_token_is_rejected(self):
+        body, signature = issue_token(SECRET, FakeUser(), 'access').split('.')
+        self.assertIsNone(verify_token(SECRET, 'abc.déf', 'access'))
+        self.assertIsNone(verify_token(SECRET, '%s.%sé' % (body, signature), 'access'))
+        self.assertIsNone(verify_token(SECRET, 'é%s.%s' % (body, signature), 'access'))
+
+    def test_type_is_checked(self):
+        refresh = issue_token(SECRET, FakeUser(), 'refresh')
+        self.assertIsNone(verify_token(SECRET, refresh, 'access'))
+        self.assertIsNotNone(verify_token(SECRET, refresh, 'refresh'))
+
+    def test_expired_token_is_rejected(self):
+        token = issue_token(SECRET, FakeUser(), 'access')
+        later = time.time() + auth_token.ACCESS_TOKEN_TTL + 1
+        with mock.patch('auth_token.time.time', return_value = later):
+            self.assertIsNone(verify_token(SECRET, token, 'access'))
+
+    def test_missing_secret_disables_tokens(self):
+        token = issue_token(SECRET, FakeUser(), 'access')
+        self.assertIsNone(verify_token('', token, 'access'))
+        self.assertIsNone(verify_token(None, token, 'access'))
+        with self.assertRaises(ValueError):
+            issue_token('', FakeUser(), 'access')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''Tests for the reminder change feed and its retention'''
+from datetime import datetime, timedelta
+import json
+import os
+import unittest
+from unittest import mock
+
+import tests
+import app as app_module
+from app import app
+from archive import prune_batch
+from auth_token import issue_token
+from model import Session, engine, User, Reminder, ReminderChange, ChangeRetention
+
+DUE_DATE = '2030-01-01T10:00:00.000Z'
+
+
+class ChangeFeedTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        session = Session()
+        cls.user = User('Feed', 'senha-teste')
+        session.add(cls.user)
+        session.commit()
+        cls.user_id = cls.user.id
+        cls.headers = {'Authorization': 'Bearer %s' % issue_token(
+            os.environ['SECRET_KEY'], cls.user, 'access')}
+        Session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        session = Session()
+        session.query(User).filter(User.id == cls.user_id).delete()
+        session.commit()
+        Session.remove()
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def tearDown(self):
+        session = Session()
+        for model in (Reminder, ReminderChange, ChangeRetention):
+            session.query(model).filter(model.user_id == self.user_id).delete()
+        session.commit()
+        Session.remove()
+
+    def create(self, name: str) -> dict:
+        response = self.client.post('/create', query_string = {'username': 'Feed'},
+                                    headers = self.headers,
+                                    data = {'name': name, 'description': 'descrição',
+                                            'due_date': DUE_DATE, 'send_email': 'false',
+                                            'recurring': 'false'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def changes(self, since: int) -> dict:
+        response = self.client.get('/reminders/changes', headers = self.headers,
+                                   query_string = {'username': 'Feed', 'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_changes_after_since(self):
+        first = self.create('Primeiro')
+        feed = self.changes(0)
+        self.assertEqual([change['reminder_id'] for change in feed['changes']], [first['id']])
+        self.assertFalse(feed['resync'])
+
+        second = self.create('Segundo')
+        feed = self.changes(feed['last_seq'])
+        self.assertEqual([(change['operation'], change['reminder']['name'])
+                          for change in feed['changes']], [('create', 'Segundo')])
+        self.assertEqual(self.changes(feed['last_seq'])['changes'], [])
+        self.assertEqual(second['id'], feed['changes'][0]['reminder_id'])
+
+    def test_update_stores_due_date_in_utc(self):
+        created = self.create('Fuso')
+        last_seq = self.changes(0)['last_seq']
+
+        def update(due_date):
+            response = self.client.put('/update', query_string = {'username': 'Feed'},
+                                       headers = self.headers,
+                                       data = {'id': created['id'], 'due_date': due_date})
+            self.assertEqual(response.status_code, 200)
+            return response.get_json()
+
+        # o mesmo instante em outro fuso não é uma alteração
+        update('2030-01-01T07:00:00-03:00')
+        self.assertEqual(self.changes(last_seq)['changes'], [])
+
+        update('2030-01-01T10:00:00-03:00')
+        session = Session()
+        reminder = session.get(Reminder, created['id'])
+        self.assertEqual(reminder.due_date, datetime(2030, 1, 1, 13, 0))
+        self.assertEqual(len(self.changes(last_seq)['changes']), 1)
+
+    def test_pruned_changes_ask_for_resync(self):
+        self.create('Antigo')
+        old_seq = self.changes(0)['last_seq']
+        self.create('Recente')
+        session = Session()
+        session.query(ReminderChange).filter(ReminderChange.seq == old_seq).update(
+            {'created_at': datetime.now() - timedelta(days = 30)})
+        session.commit()
+
+        self.assertEqual(prune_batch(engine, datetime.now() - timedelta(days = 7), 100), 1)
+        feed = self.changes(0)
+        self.assertEqual(feed, {'changes': [], 'last_seq': old_seq, 'resync': True})
+        feed = self.changes(old_seq)
+        self.assertEqual([change['reminder']['name'] for change in feed['changes']], ['Recente'])
+
+    def test_stream_sends_changes_and_resync(self):
+        self.create('Stream')
+        session = Session()
+        last_seq = self.changes(0)['last_seq']
+        session.merge(ChangeRetention(user_id = self.user_id, pruned_seq = last_seq - 1))
+        session.commit()
+        with mock.patch.multiple(app_module, CHANGES_STREAM_MAX_SECONDS = 0.1,
+                                 CHANGES_POLL_INTERVAL = 0.01):
+            response = self.client.get('/reminders/changes/stream', headers = self.headers,
+                                       query_string = {'username': 'Feed', 'since': 0})
+            body = response.get_data(as_text = True)
+        self.assertEqual(response.status_code, 200)
+        events = [event for event in body.split('\n\n') if event.startswith('id:')]
+        self.assertIn('event: resync', events[0])
+        self.assertEqual(json.loads(events[-1].split('data: ')[1])['reminder']['name'], 'Stream')
+
+    def test_stream_limit_returns_503(self):
+        with mock.patch.object(app_module, 'stream_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.client.get('/reminders/changes/stream', headers = self.headers,
+                                       query_string = {'username': 'Feed'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+'''Tests for the storage of idempotent responses'''
+import unittest
+
+import tests
+from model import Session, User, IdempotencyKey
+from idempotency import save_response, find_response, request_fingerprint
+
+
+class IdempotencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = Session()
+        self.user = User('Idempotente', 'senha-teste')
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == self.user.id).delete()
+        self.session.delete(self.user)
+        self.session.commit()
+        Session.remove()
+
+    def test_first_writer_keeps_the_key(self):
+        self.assertTrue(save_response(self.session, self.user.id, 'chave', 'a', 200, '{}'))
+        self.session.commit()
+
+        other = Session()
+        self.assertFalse(save_response(other, self.user.id, 'chave', 'b', 409, '[]'))
+        other.rollback()
+        saved = find_response(other, self.user.id, 'chave')
+        self.assertEqual((saved.fingerprint, saved.status), ('a', 200))
+
+    def test_rolled_back_request_leaves_no_key(self):
+        self.assertTrue(save_response(self.session, self.user.id, 'chave', 'a', 200, '{}'))
+        self.session.rollback()
+        self.assertIsNone(find_response(self.session, self.user.id, 'chave'))
+
+    def test_fingerprint_separates_fields(self):
+        self.assertNotEqual(request_fingerprint({'name': 'a&recurring=b'}),
+                            request_fingerprint({'name': 'a', 'recurring': 'b'}))
+        self.assertEqual(request_fingerprint({'name': 'a', 'recurring': False}),
+                         request_fingerprint({'recurring': False, 'name': 'a'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+'''Tests for the migration of databases created with the original schema'''
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, inspect, text
+
+import tests
+from model.migration import migrate_email_inline, migrate_reminder_name_per_user, \
+                            migrate_reminder_change_autoincrement
+
+# Schema das tabelas como eram criadas antes das migrações.
+BASELINE_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR(32) NOT NULL,
+        password_hash VARCHAR(128) NOT NULL, created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (username))''',
+    '''CREATE TABLE reminders (
+        pk_reminder INTEGER NOT NULL, name VARCHAR(60), name_normalized VARCHAR(140),
+        description VARCHAR(255), due_date DATETIME, send_email BOOLEAN, recurring BOOLEAN,
+        user_id INTEGER NOT NULL, created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (pk_reminder), UNIQUE (name), FOREIGN KEY(user_id) REFERENCES users (id))''',
+    '''CREATE TABLE emails (
+        id INTEGER NOT NULL, email VARCHAR(60), reminder INTEGER NOT NULL,
+        created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(reminder) REFERENCES reminders (pk_reminder))''',
+]
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        path = tempfile.mkstemp(prefix = 'baseline-', suffix = '.sqlite3',
+                                dir = tests.TEST_DB_PATH)[1]
+        self.engine = create_engine('sqlite:///%s' % path)
+        with self.engine.begin() as connection:
+            for statement in BASELINE_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text(
+                "INSERT INTO users (id, username, password_hash) VALUES "
+                "(1, 'Ana', 'hash'), (2, 'Bia', 'hash')"))
+            connection.execute(text(
+                "INSERT INTO reminders (pk_reminder, name, user_id) VALUES "
+                "(1, 'Mercado', 1), (2, 'Banco', 2)"))
+            connection.execute(text(
+                "INSERT INTO emails (id, email, reminder) VALUES (1, 'ana@email.com', 1)"))
+
+    def rows(self, sql: str) -> list:
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(text(sql))]
+
+    def test_email_moves_into_reminders(self):
+        migrate_email_inline(self.engine)
+
+        self.assertNotIn('emails', inspect(self.engine).get_table_names())
+        self.assertEqual(self.rows('SELECT pk_reminder, email FROM reminders '
+                                   'ORDER BY pk_reminder'),
+                         [(1, 'ana@email.com'), (2, None)])
+        # migrar de novo não altera o banco
+        migrate_email_inline(self.engine)
+        self.assertEqual(len(self.rows('SELECT * FROM reminders')), 2)
+
+    def test_reminder_name_becomes_unique_per_user(self):
+        # mesma ordem de model/__init__.py: a recriação da tabela já copia a coluna email
+        migrate_email_inline(self.engine)
+        migrate_reminder_name_per_user(self.engine)
+
+        unique_columns = [constraint['column_names'] for constraint
+                          in inspect(self.engine).get_unique_constraints('reminders')]
+        self.assertEqual(unique_columns, [['user_id', 'name']])
+        self.assertEqual(self.rows('SELECT pk_reminder, name, user_id FROM reminders '
+                                   'ORDER BY pk_reminder'),
+                         [(1, 'Mercado', 1), (2, 'Banco', 2)])
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO reminders (name, user_id) VALUES ('Mercado', 2)"))
+        # migrar de novo não altera o banco
+        migrate_reminder_name_per_user(self.engine)
+        self.assertEqual(len(self.rows('SELECT * FROM reminders')), 3)
+
+    def test_change_seq_is_never_reused(self):
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE reminder_changes (seq INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+                'reminder_id INTEGER NOT NULL, operation VARCHAR(10) NOT NULL, reminder TEXT, '
+                'created_at DATETIME, PRIMARY KEY (seq))'))
+            connection.execute(text(
+                'CREATE INDEX ix_reminder_changes_user_id ON reminder_changes (user_id)'))
+            connection.execute(text(
+                "INSERT INTO reminder_changes (seq, user_id, reminder_id, operation) "
+                "VALUES (5, 1, 1, 'create')"))
+
+        migrate_reminder_change_autoincrement(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(text('DELETE FROM reminder_changes'))
+            connection.execute(text(
+                "INSERT INTO reminder_changes (user_id, reminder_id, operation) "
+                "VALUES (1, 1, 'update')"))
+        self.assertEqual(self.rows('SELECT seq FROM reminder_changes'), [(6,)])
+        self.assertIn('ix_reminder_changes_user_id',
+                      [index['name'] for index in inspect(self.engine).get_indexes('reminder_changes')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+'''Tests for the opt-in request profiler'''
+import cProfile
+from collections import Counter
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import tests
+import profiler
+from profiler import ProfileStore, init_profiler, UNMATCHED_ROUTE
+
+ADMIN_TOKEN = 'token-de-admin'
+
+
+class ProfileStoreTest(unittest.TestCase):
+
+    def test_profiles_are_aggregated_by_route(self):
+        store = ProfileStore()
+        for _ in range(2):
+            profile = cProfile.Profile()
+            profile.enable()
+            sorted(range(10))
+            profile.disable()
+            store.add('GET /reminders', profile, Counter({'app.py:route': 3}))
+
+        self.assertEqual(store.routes(), {'GET /reminders': 2})
+        self.assertIn('sorted', store.pstats_text('GET /reminders'))
+        self.assertEqual(store.collapsed_text('GET /reminders'), 'app.py:route 6')
+        self.assertEqual(store.pstats_text('GET /outra'), '')
+        store.reset()
+        self.assertEqual(store.routes(), {})
+
+
+class ProfilerHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(profiler, PROFILE_ADMIN_TOKEN = ADMIN_TOKEN,
+                                      PROFILE_SAMPLE_RATE = 0,
+                                      profile_store = ProfileStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+        app.add_url_rule('/ok', 'ok', lambda: 'ok')
+        self.assertTrue(init_profiler(app))
+        self.client = app.test_client()
+
+    def test_only_admin_requests_are_profiled(self):
+        self.client.get('/ok')
+        self.client.get('/ok', headers = {'X-Profile-Token': 'errado'})
+        self.client.get('/ok', headers = {'X-Profile-Token': ADMIN_TOKEN})
+        self.assertEqual(profiler.profile_store.routes(), {'GET /ok': 1})
+
+    def test_non_ascii_token_is_not_an_error(self):
+        response = self.client.get('/ok', headers = {'X-Profile-Token': 'é'.encode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(profiler.profile_store.routes(), {})
+
+    def test_unmatched_paths_share_one_entry(self):
+        for number in range(3):
+            self.client.get('/nope/%d' % number, headers = {'X-Profile-Token': ADMIN_TOKEN})
+        self.assertEqual(profiler.profile_store.routes(), {'GET %s' % UNMATCHED_ROUTE: 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
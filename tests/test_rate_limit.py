@@ -0,0 +1,95 @@
+'''Tests for the token bucket rate limiting'''
+from types import SimpleNamespace
+import os
+import tempfile
+import unittest
+
+import tests
+from rate_limit import MemoryBackend, SQLiteBackend, RateLimiter, parse_limit, parse_overrides
+
+
+class MemoryBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend(max_buckets = 3, sweep_interval = 10)
+        # 2 requisições a cada 4 segundos: um token a cada 2 segundos
+        self.capacity, self.rate = parse_limit('2/4')
+
+    def consume(self, key: str, now: float) -> float:
+        return self.backend.consume(key, self.capacity, self.rate, now)
+
+    def test_retry_after_until_next_token(self):
+        self.assertEqual(self.consume('ip', 100), 0)
+        self.assertEqual(self.consume('ip', 100), 0)
+        self.assertAlmostEqual(self.consume('ip', 100), 2)
+        self.assertAlmostEqual(self.consume('ip', 101.5), 0.5)
+
+    def test_bucket_refills_over_time(self):
+        self.consume('ip', 100)
+        self.consume('ip', 100)
+        self.assertEqual(self.consume('ip', 102), 0)
+        self.assertGreater(self.consume('ip', 102), 0)
+        # a recarga nunca passa da capacidade
+        self.assertEqual(self.consume('ip', 1000), 0)
+        self.assertEqual(self.consume('ip', 1000), 0)
+        self.assertGreater(self.consume('ip', 1000), 0)
+
+    def test_full_buckets_are_swept(self):
+        self.consume('antigo', 100)
+        self.consume('recente', 115)
+        self.assertEqual(list(self.backend.buckets), ['recente'])
+
+    def test_least_recently_used_bucket_is_dropped(self):
+        for key in ('a', 'b', 'c'):
+            self.consume(key, 100)
+        self.consume('a', 100)
+        self.consume('d', 100)
+        self.assertEqual(list(self.backend.buckets), ['c', 'a', 'd'])
+
+
+class SQLiteBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(dir = tests.TEST_DB_PATH), 'rate_limit.sqlite3')
+        self.backend = SQLiteBackend(path, sweep_interval = 10)
+
+    def test_uses_wal_without_full_sync(self):
+        connection = self.backend._connection()
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        # 1 = NORMAL
+        self.assertEqual(connection.execute('PRAGMA synchronous').fetchone()[0], 1)
+
+    def test_retry_after_and_sweep(self):
+        capacity, rate = parse_limit('1/10')
+        self.assertEqual(self.backend.consume('ip', capacity, rate, 100), 0)
+        self.assertAlmostEqual(self.backend.consume('ip', capacity, rate, 105), 5)
+        self.backend.consume('outro', capacity, rate, 200)
+        keys = self.backend._connection().execute('SELECT key FROM buckets').fetchall()
+        self.assertEqual(keys, [('outro',)])
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = RateLimiter(MemoryBackend(), {None: '1/60'})
+
+    def request(self, remote_addr: str):
+        return SimpleNamespace(url_rule = SimpleNamespace(rule = '/reminders'),
+                               remote_addr = remote_addr)
+
+    def test_unverified_requests_use_only_the_ip_bucket(self):
+        self.assertEqual(self.limiter.check(self.request('10.0.0.1')), 0)
+        self.assertEqual(list(self.limiter.backend.buckets), ['ip:10.0.0.1:/reminders'])
+
+    def test_user_bucket_is_shared_across_ips(self):
+        self.assertEqual(self.limiter.check(self.request('10.0.0.1'), 7), 0)
+        self.assertEqual(self.limiter.check(self.request('10.0.0.2'), 7), 60)
+        self.assertEqual(self.limiter.check(self.request('10.0.0.3')), 0)
+
+    def test_default_limit_can_be_overridden(self):
+        self.assertEqual(parse_overrides('{"default": "5/60", "/create": "1/60"}'),
+                         {None: '5/60', '/create': '1/60'})
+
+
+if __name__ == '__main__':
+    unittest.main()
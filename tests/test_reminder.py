@@ -0,0 +1,33 @@
+'''Tests for the reminder model'''
+from datetime import datetime
+import unittest
+
+import tests
+from model import Reminder
+
+
+class ChangedValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reminder = Reminder('Mercado', 'leite', 1, due_date = datetime(2030, 1, 1),
+                                 send_email = False, recurring = False, email = 'a@email.com')
+
+    def test_fields_not_sent_are_ignored(self):
+        self.assertEqual(self.reminder.changed_values(), {})
+
+    def test_same_values_are_not_changes(self):
+        self.assertEqual(self.reminder.changed_values(
+            name = 'Mercado', description = 'leite', due_date = datetime(2030, 1, 1),
+            send_email = False, email = 'a@email.com', recurring = False), {})
+
+    def test_only_changed_fields_are_returned(self):
+        self.assertEqual(self.reminder.changed_values(description = 'pão', send_email = True),
+                         {'description': 'pão', 'send_email': True})
+
+    def test_new_name_updates_normalized_name(self):
+        self.assertEqual(self.reminder.changed_values(name = 'Açougue'),
+                         {'name': 'Açougue', 'name_normalized': 'acougue'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+'''Tests for the sharding of reminders by user'''
+from datetime import datetime
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+
+import tests
+from model import Base, Reminder, ArchivedReminder, ReminderChange, ReminderIdRange
+from model.shard import ShardedSessionFactory, create_shard_engine, next_reminder_id, \
+                        rebalance, REMINDER_ID_SPAN
+
+
+class ShardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp(prefix = 'api1-shards-', dir = tests.TEST_DB_PATH)
+        self.main_engine = create_engine('sqlite:///%s/db.sqlite3' % self.db_path)
+        Base.metadata.create_all(self.main_engine)
+
+    def reminder_ids(self, index: int, table = Reminder.__table__) -> list:
+        shard_engine = create_shard_engine(self.db_path, index)
+        with shard_engine.connect() as connection:
+            return connection.execute(
+                select(table.c.pk_reminder).order_by(table.c.pk_reminder)).scalars().all()
+
+    def insert_reminder(self, session, user_id: int, name: str) -> int:
+        statement = insert(Reminder).values(
+            name = name, user_id = user_id, pk_reminder = next_reminder_id(user_id))
+        return session.execute(statement).lastrowid
+
+    def test_allocated_ids_stay_in_user_range(self):
+        shard_engine = create_shard_engine(self.db_path, 1)
+        factory = ShardedSessionFactory(self.main_engine, [create_shard_engine(self.db_path, 0),
+                                                           shard_engine])
+        session = factory(3)
+        first = self.insert_reminder(session, 3, 'Primeiro')
+        second = self.insert_reminder(session, 3, 'Segundo')
+        session.execute(Reminder.__table__.delete().where(Reminder.__table__.c.pk_reminder == second))
+        third = self.insert_reminder(session, 3, 'Terceiro')
+        session.commit()
+        factory.remove()
+        self.assertEqual(first, 3 * REMINDER_ID_SPAN + 1)
+        self.assertEqual(second, first + 1)
+        # o id do lembrete removido não é reaproveitado
+        self.assertEqual(third, second + 1)
+
+    def test_exhausted_id_range_is_rejected(self):
+        shard_engine = create_shard_engine(self.db_path, 1)
+        with shard_engine.begin() as connection:
+            connection.execute(ReminderIdRange.__table__.insert(),
+                               [{'user_id': 3, 'last_id': 4 * REMINDER_ID_SPAN - 1}])
+        with shard_engine.connect() as connection:
+            with self.assertRaises(IntegrityError):
+                connection.execute(insert(Reminder).values(
+                    name = 'Demais', user_id = 3, pk_reminder = next_reminder_id(3)))
+
+    def test_rebalance_moves_user_between_shard_files(self):
+        with self.main_engine.begin() as connection:
+            connection.execute(Reminder.__table__.insert(), [
+                {'pk_reminder': 2 * REMINDER_ID_SPAN + 1, 'name': 'Dois', 'user_id': 2},
+                {'pk_reminder': 3 * REMINDER_ID_SPAN + 1, 'name': 'Três', 'user_id': 3},
+            ])
+            connection.execute(ArchivedReminder.__table__.insert(),
+                               [{'pk_reminder': 3 * REMINDER_ID_SPAN + 2, 'name': 'Antigo',
+                                 'user_id': 3, 'archived_at': datetime.now()}])
+            connection.execute(ReminderChange.__table__.insert(), [
+                {'seq': 7, 'user_id': 3, 'reminder_id': 3 * REMINDER_ID_SPAN + 1,
+                 'operation': 'create'},
+            ])
+
+        self.assertEqual(rebalance(self.db_path, self.main_engine, 2),
+                         {'moved_users': 2, 'shards': 2})
+        self.assertEqual(self.reminder_ids(0), [2 * REMINDER_ID_SPAN + 1])
+        self.assertEqual(self.reminder_ids(1), [3 * REMINDER_ID_SPAN + 1])
+
+        # com 3 shards, o usuário 3 sai do shard 1 e vai para o shard 0
+        self.assertEqual(rebalance(self.db_path, self.main_engine, 3),
+                         {'moved_users': 2, 'shards': 3})
+        self.assertEqual(self.reminder_ids(0), [3 * REMINDER_ID_SPAN + 1])
+        self.assertEqual(self.reminder_ids(0, ArchivedReminder.__table__),
+                         [3 * REMINDER_ID_SPAN + 2])
+        self.assertEqual(self.reminder_ids(1), [])
+        self.assertEqual(self.reminder_ids(2), [2 * REMINDER_ID_SPAN + 1])
+        self.assertTrue(os.path.exists(os.path.join(self.db_path, 'shard_2.sqlite3')))
+
+        with create_shard_engine(self.db_path, 0).connect() as connection:
+            changes = connection.execute(select(ReminderChange.__table__)).mappings().all()
+        self.assertEqual([change['user_id'] for change in changes], [3])
+        self.assertGreaterEqual(changes[0]['seq'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()